@@ -1,23 +1,151 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import requests
+import json
+import logging
+import math
 import os
 import time
-import base64
+import uuid
+
+from batch import fan_out
+from callback_queue import CallbackQueue, CallbackWorker
+from idempotency import Idempotency, MemoryIdempotencyStore, SQLiteIdempotencyStore, fingerprint
+from logs import mask_text, setup_logging
+import metrics
+from payhero_client import PayHeroClient
+from ratelimit import SQLiteTokenBucket, TokenBucket
+from resilience import (
+    CircuitBreaker, CircuitOpenError, RateLimitedError, ResilientPayHero, is_connect_error,
+)
+from schemas import CallbackSchema, PushRequestSchema
+from settings import load_settings
+from status_cache import StatusBroadcast, StatusCache, is_final, status_from_transaction
+from transactions import SQLiteTransactionRepository, callback_update
+
+# ================== SETTINGS ==================
+# Read and validated once; a bad deploy fails here, not on the first request
+settings = load_settings()
+# ===================================================
+
+setup_logging(settings.log_level)
+log = logging.getLogger("okoa")
 
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app)
 
-# ================== ENV VARIABLES ==================
-PAYHERO_API_USERNAME = os.getenv("PAYHERO_API_USERNAME")
-PAYHERO_API_PASSWORD = os.getenv("PAYHERO_API_PASSWORD")
+# 🔐 Basic Auth header is built once here, not on every request
+payhero = PayHeroClient(
+    settings.payhero_api_username,
+    settings.payhero_api_password,
+    url=settings.payhero_url,
+    # A batch fans out up to batch_max_concurrency calls over this one
+    # client, even in a single-threaded sync worker
+    pool_size=max(settings.payhero_pool_size, settings.batch_max_concurrency),
+    connect_timeout=settings.payhero_connect_timeout,
+    read_timeout=settings.payhero_read_timeout,
+)
 
-PAYHERO_CHANNEL_ID = os.getenv("PAYHERO_CHANNEL_ID")  # 5217
-CALLBACK_URL = os.getenv("CALLBACK_URL")  # https://okoa-chapaa-backend.onrender.com/api/payhero/callback
+if settings.rate_limit_backend == "memory":
+    payhero_limiter = TokenBucket(settings.payhero_rate_limit, settings.payhero_rate_limit_burst)
+else:
+    payhero_limiter = SQLiteTokenBucket(
+        settings.rate_limit_db, settings.payhero_rate_limit, settings.payhero_rate_limit_burst
+    )
+
+payhero_upstream = ResilientPayHero(
+    payhero,
+    CircuitBreaker(
+        failure_rate=settings.breaker_failure_rate,
+        slow_call_rate=settings.breaker_slow_call_rate,
+        slow_call_seconds=settings.breaker_slow_call_seconds,
+        window_seconds=settings.breaker_window_seconds,
+        min_calls=settings.breaker_min_calls,
+        open_seconds=settings.breaker_open_seconds,
+    ),
+    payhero_limiter,
+    retries=settings.payhero_connect_retries,
+)
+
+transactions = SQLiteTransactionRepository(
+    settings.transactions_db, pool_size=settings.db_pool_size
+)
+callback_queue = CallbackQueue(settings.callback_queue_db)
+
+
+def process_callbacks(payloads):
+    """Apply a batch of queued PayHero callbacks to the ledger in one transaction."""
+    updates = [callback_update(payload) for payload in payloads]
+    transactions.apply_callbacks([update for update in updates if update])
+
+
+# Every gunicorn worker drains the shared queue; row leases keep them apart
+callback_worker = CallbackWorker(
+    callback_queue,
+    process_callbacks,
+    threads=settings.callback_worker_threads,
+    batch_size=settings.callback_batch_size,
+)
+callback_worker.start()
+
+status_cache = StatusCache(ttl=settings.status_cache_ttl)
+status_broadcast = StatusBroadcast(settings.status_events_db, status_cache)
+status_broadcast.start()
+
+# A duplicate may wait this long for the original call, connect retries
+# included, to finish; the in-flight claim lives as long
+_idempotency_wait = payhero_upstream.max_call_seconds()
+if settings.idempotency_backend == "memory":
+    idempotency_store = MemoryIdempotencyStore(
+        ttl=settings.idempotency_ttl,
+        max_entries=settings.idempotency_max_keys,
+        in_flight_ttl=_idempotency_wait,
+    )
+else:
+    idempotency_store = SQLiteIdempotencyStore(
+        settings.idempotency_db,
+        ttl=settings.idempotency_ttl,
+        max_entries=settings.idempotency_max_keys,
+        in_flight_ttl=_idempotency_wait,
+    )
+idempotency = Idempotency(idempotency_store, wait_timeout=_idempotency_wait)
+
+
+def sync_batch_max_items(concurrency):
+    """Largest batch a sync worker is sure to finish before gunicorn kills it.
+
+    gunicorn kills a sync worker whose request outlives its timeout, which
+    would cut a streamed batch off mid-way and strand the rest as PENDING.
+    Worst case, n items take n / rate seconds of tokens plus one
+    max_call_seconds() per wave of ``concurrency`` calls. Returns None when
+    no such limit applies (async mode, or not under gunicorn).
+    """
+    if settings.serving_mode != "sync" or not settings.worker_timeout:
+        return None
+    call_seconds = payhero_upstream.max_call_seconds()
+    best = 0
+    for waves in range(1, int(settings.worker_timeout // call_seconds) + 1):
+        token_budget = (settings.worker_timeout - waves * call_seconds) * settings.payhero_rate_limit
+        best = max(best, min(waves * concurrency, int(token_budget)))
+    return best
+
+
+push_schema = PushRequestSchema(settings.min_amount, settings.max_amount)
+callback_schema = CallbackSchema()
 
-# PayHero v2 STK Push endpoint
-PAYHERO_URL = "https://backend.payhero.co.ke/api/v2/payments"
-# ===================================================
+
+def validation_error(errors):
+    return jsonify({"error": "invalid request", "fields": errors}), 422
+
+
+def api_response(body, status_code, replayed=False):
+    response = jsonify(body)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    if status_code in (429, 503) and "retry_after" in body:
+        response.headers["Retry-After"] = str(body["retry_after"])
+    return response, status_code
 
 
 @app.route("/", methods=["GET"])
@@ -27,65 +155,329 @@ def home():
 
 @app.route("/api/stk-push", methods=["POST"])
 def stk_push():
-    data = request.get_json(force=True)
+    data = request.get_json(force=True, silent=True)
+
+    push, errors = push_schema.validate(data)
+    if errors:
+        return validation_error(errors)
+
+    payload = build_payload(push)
 
-    phone = data.get("phone")
-    amount = data.get("amount")
-    reference = data.get("reference", f"OKOA_{int(time.time())}")
-    customer_name = data.get("customer_name", "Customer")
+    # Double-taps reuse the client's reference (or an explicit key) and get
+    # the first push's response back instead of a second STK prompt; the
+    # same key with a different request is refused
+    key = request.headers.get("Idempotency-Key") or push["reference"]
+    if not key:
+        return api_response(*send_stk_push(payload))
 
-    if not phone or not amount:
-        return jsonify({"error": "phone and amount are required"}), 400
+    return api_response(
+        *idempotency.run(f"stk-push:{key}", lambda: send_stk_push(payload), fingerprint(push))
+    )
 
-    # 🔐 Build Basic Auth token
-    auth_string = f"{PAYHERO_API_USERNAME}:{PAYHERO_API_PASSWORD}"
-    auth_token = base64.b64encode(auth_string.encode()).decode()
 
-    payload = {
-        "amount": int(amount),
-        "phone_number": phone,
-        "channel_id": int(PAYHERO_CHANNEL_ID),
+def build_payload(push):
+    """PayHero request body for a push that passed ``push_schema``."""
+    return {
+        "amount": push["amount"],
+        "phone_number": push["phone"],
+        "channel_id": settings.payhero_channel_id,
         "provider": "m-pesa",
-        "external_reference": reference,
-        "customer_name": customer_name,
-        "callback_url": CALLBACK_URL
+        "external_reference": push["reference"] or f"OKOA_{int(time.time())}_{uuid.uuid4().hex[:8]}",
+        "customer_name": push["customer_name"],
+        "callback_url": settings.callback_url
         # credential_id is OPTIONAL → only if using your own Daraja keys
     }
 
-    headers = {
-        "Authorization": f"Basic {auth_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
 
+@app.route("/api/stk-push/batch", methods=["POST"])
+def stk_push_batch():
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return validation_error({"body": "must be a JSON object"})
+
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return validation_error({"items": "must be a non-empty list"})
+    if len(items) > settings.batch_max_items:
+        return validation_error({"items": f"at most {settings.batch_max_items} items per batch"})
+
+    try:
+        concurrency = int(data.get("concurrency", settings.batch_concurrency))
+    except (TypeError, ValueError):
+        return validation_error({"concurrency": "must be an integer"})
+    concurrency = max(1, min(concurrency, settings.batch_max_concurrency))
+
+    max_items = sync_batch_max_items(concurrency)
+    if max_items is not None and len(items) > max_items:
+        return validation_error({"items": (
+            f"at most {max_items} items per batch at concurrency {concurrency} in sync "
+            "serving mode, or a slow PayHero could get the worker killed part-way; "
+            "raise concurrency or use async mode for larger batches"
+        )})
+
+    # Reject the whole batch before any push goes out if any item is bad
+    pushes, errors = [], []
+    for index, item in enumerate(items):
+        push, item_errors = push_schema.validate(item)
+        if item_errors:
+            errors.append({"index": index, "fields": item_errors})
+        elif not errors:
+            pushes.append(push)
+    if errors:
+        return jsonify({"error": "invalid items", "items": errors}), 422
+
+    def results():
+        succeeded = 0
+        for result in fan_out(enumerate(pushes), push_batch_item, concurrency):
+            succeeded += result["status_code"] < 300
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "total": len(pushes), "succeeded": succeeded}) + "\n"
+
+    # One NDJSON line per item, in completion order, as each push finishes
+    return Response(stream_with_context(results()), mimetype="application/x-ndjson")
+
+
+def push_batch_item(indexed_push):
+    index, push = indexed_push
+    payload = build_payload(push)
+    reference = payload["external_reference"]
+
+    def send():
+        return send_stk_push(payload, token_held=True)
+
+    # A failed item is reported on its own line and never aborts the batch
     try:
-        response = requests.post(
-            PAYHERO_URL,
-            json=payload,
-            headers=headers,
-            timeout=30
+        # Batches queue for rate-limit tokens instead of failing items with
+        # 429, and do it before claiming the key so the claim is not held
+        # (and duplicates kept waiting) for the length of the queue
+        payhero_upstream.wait_for_token()
+        body, status_code, replayed = idempotency.run(
+            f"stk-push:{reference}", send, fingerprint(push)
+        )
+    except CircuitOpenError as e:
+        body, status_code, replayed = (
+            {"error": str(e), "retry_after": math.ceil(e.retry_after)}, 503, False
         )
+    except Exception as e:
+        body, status_code, replayed = {"error": "Request failed", "details": str(e)}, 500, False
 
-        print("=== STK PUSH REQUEST ===")
-        print("STATUS:", response.status_code)
-        print("RESPONSE:", response.text)
+    return {
+        "index": index,
+        "reference": reference,
+        "status_code": status_code,
+        "replayed": replayed,
+        "response": body,
+    }
+
+
+def send_stk_push(payload, token_held=False):
+    """Record and send one STK push; returns ``(body, status_code)``."""
+    reference = payload["external_reference"]
+    if not transactions.create_pending(
+        reference, payload["phone_number"], payload["amount"], payload["customer_name"]
+    ):
+        # Already accepted by PayHero (or still in flight): never prompt twice
+        return {"error": "reference already used", "reference": reference}, 409
+
+    try:
+        response = payhero_upstream.post_payment(payload, token_held=token_held)
+
+        metrics.PAYHERO_LATENCY.observe(response.timing.total)
+        metrics.PAYHERO_RESPONSES.labels(response.status_code).inc()
+
+        body = response.json()
+        log.info("stk_push.response", extra={"fields": {
+            "reference": reference,
+            "phone_number": payload["phone_number"],
+            "status_code": response.status_code,
+            "timing": response.timing.as_dict(),
+            # Parsed, not raw text, so the formatter can mask phone fields in it
+            "response": body if not response.ok else None,
+        }})
+
+        if response.ok:
+            record_push_result(reference, body.get("status", "QUEUED"), body.get("CheckoutRequestID"))
+        else:
+            record_push_result(
+                reference, "PUSH_FAILED", result_desc=payhero_error_message(body, response.status_code)
+            )
+
+        return body, response.status_code
 
-        return jsonify(response.json()), response.status_code
+    except (RateLimitedError, CircuitOpenError) as e:
+        # Fail fast rather than queue behind a degraded PayHero
+        record_push_result(reference, "NOT_SENT", result_desc=str(e))
+        status_code = 429 if isinstance(e, RateLimitedError) else 503
+        metrics.PAYHERO_RESPONSES.labels(
+            "rate_limited" if status_code == 429 else "circuit_open"
+        ).inc()
+        log.warning("stk_push.not_sent", extra={"fields": {"reference": reference, "reason": str(e)}})
+        return {"error": str(e), "retry_after": math.ceil(e.retry_after)}, status_code
 
     except requests.exceptions.RequestException as e:
-        print("REQUEST ERROR:", str(e))
-        return jsonify({"error": "Request failed", "details": str(e)}), 500
+        metrics.PAYHERO_RESPONSES.labels("error").inc()
+        log.error("stk_push.request_error", extra={"fields": {"reference": reference, "error": str(e)}})
+        # Only a failed connect proves PayHero never saw the push. After a
+        # read timeout (or a garbled answer) it may have prompted the
+        # customer, so the reference waits for the callback instead of
+        # being pushed again.
+        status = "ERROR" if is_connect_error(e) else "UNKNOWN"
+        record_push_result(reference, status, result_desc=str(e))
+        return {"error": "Request failed", "details": str(e), "status": status}, 500
+
+
+def payhero_error_message(body, status_code):
+    """What to keep of a PayHero error response: its message field only, with
+    phone numbers masked, since the ledger serves it back on status lookups."""
+    if isinstance(body, dict):
+        for key in ("error_message", "message", "error"):
+            if isinstance(body.get(key), str) and body[key]:
+                return mask_text(body[key])[:200]
+    return f"PayHero returned HTTP {status_code}"
+
+
+def record_push_result(reference, status, checkout_request_id=None, result_desc=None):
+    # The callback may have beaten the push response; it has the last word
+    if not transactions.record_push_result(reference, status, checkout_request_id, result_desc):
+        return
+    status_broadcast.publish({
+        "reference": reference,
+        "status": status,
+        "checkout_request_id": checkout_request_id,
+        "result_code": None,
+        "result_desc": result_desc,
+        "mpesa_receipt_number": None,
+    })
 
 
 @app.route("/api/payhero/callback", methods=["POST"])
 def payhero_callback():
-    data = request.get_json(force=True)
-    print("=== PAYHERO CALLBACK RECEIVED ===")
-    print(data)
+    data = request.get_json(force=True, silent=True)
+    log.info("payhero_callback.received", extra={"fields": {"payload": data}})
+
+    update, errors = callback_schema.validate(data)
+    if errors:
+        return validation_error(errors)
+
+    def enqueue():
+        # Only persist here; CallbackWorker applies it to the ledger
+        callback_queue.put(data)
+        metrics.count_callback(update["status"])
+        # Status polls are answered from the cache, so update it right away
+        # rather than when the worker gets to the ledger
+        if update["external_reference"]:
+            status_broadcast.publish({
+                "reference": update["external_reference"],
+                "status": update["status"],
+                "checkout_request_id": update["checkout_request_id"],
+                "result_code": update["result_code"],
+                "result_desc": update["result_desc"],
+                "mpesa_receipt_number": update["mpesa_receipt_number"],
+            })
+        return {"status": "received"}, 200
+
+    # PayHero redelivers callbacks; queue each outcome for a push only once
+    key = f"callback:{update['checkout_request_id'] or update['external_reference']}:{update['status']}"
+    body, status_code, replayed = idempotency.run(key, enqueue)
+    if replayed:
+        metrics.DUPLICATE_CALLBACKS.inc()
+    return api_response(body, status_code, replayed)
+
+
+@app.route("/api/transactions/<reference>", methods=["GET"])
+def get_transaction(reference):
+    transaction = transactions.get(reference)
+    if transaction is None:
+        return jsonify({"error": "transaction not found"}), 404
+    return jsonify(transaction), 200
+
+
+@app.route("/api/stk-push/<reference>/status", methods=["GET"])
+def stk_push_status(reference):
+    status = lookup_status(reference)
+    if status is None:
+        return jsonify({"error": "transaction not found"}), 404
+
+    # ?wait=N turns this into a long poll that returns as soon as the status changes
+    try:
+        wait = min(float(request.args.get("wait", 0)), settings.status_wait_max)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+    # A sync worker held on a long poll serves nobody else for that long, so
+    # there the wait is ignored and the current status returned right away
+    if settings.serving_mode != "async":
+        wait = 0
+
+    if wait > 0 and not is_final(status):
+        status = status_cache.wait(reference, status, wait)
+    return jsonify(status), 200
+
+
+@app.route("/api/stk-push/<reference>/status/stream", methods=["GET"])
+def stk_push_status_stream(reference):
+    # Same reason as the long poll: a stream would pin a whole sync worker
+    if settings.serving_mode != "async":
+        return jsonify({
+            "error": "status streaming needs OKOA_SERVING_MODE=async; "
+                     f"poll /api/stk-push/{reference}/status instead",
+        }), 501
+
+    status = lookup_status(reference)
+    if status is None:
+        return jsonify({"error": "transaction not found"}), 404
+
+    def events():
+        current = status
+        deadline = time.monotonic() + settings.status_wait_max
+        yield f"event: status\ndata: {json.dumps(current)}\n\n"
+        while not is_final(current):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            latest = status_cache.wait(reference, current, min(remaining, 15))
+            if latest == current:
+                yield ": keep-alive\n\n"
+                continue
+            current = latest
+            yield f"event: status\ndata: {json.dumps(current)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+def lookup_status(reference):
+    """Status from the cache, falling back to the ledger once per reference."""
+    status = status_cache.get(reference)
+    if status is None:
+        transaction = transactions.get(reference)
+        if transaction is None:
+            return None
+        status = status_from_transaction(transaction)
+        status_cache.put(status)
+    return status
+
+
+@app.route("/internal/callback-queue", methods=["GET"])
+def callback_queue_stats():
+    return jsonify({**callback_queue.stats(), **callback_worker.stats()}), 200
+
+
+@app.route("/internal/resilience", methods=["GET"])
+def resilience_stats():
+    return jsonify(payhero_upstream.stats()), 200
+
+
+@app.route("/internal/status-cache", methods=["GET"])
+def status_cache_stats():
+    return jsonify(status_cache.stats()), 200
 
-    # TODO: save transaction status to DB here
 
-    return jsonify({"status": "received"}), 200
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
 
 
 if __name__ == "__main__":
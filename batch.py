@@ -0,0 +1,26 @@
+"""Bounded-concurrency fan-out for batch STK pushes."""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+
+def fan_out(items, fn, concurrency):
+    """Yield ``fn(item)`` for each item as it finishes, at most ``concurrency`` at a time.
+
+    Items are submitted lazily, so only ``concurrency`` results are ever held
+    in memory. ``fn`` should handle its own errors; an exception escaping it
+    ends the iteration. Closing the generator early stops submitting new
+    items and waits for those already running.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="stk-batch") as pool:
+        pending = {pool.submit(fn, item) for item in islice(items, concurrency)}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for item in islice(items, 1):
+                        pending.add(pool.submit(fn, item))
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
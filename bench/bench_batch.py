@@ -0,0 +1,66 @@
+"""Items/sec of POST /api/stk-push/batch against a local fake PayHero, by concurrency.
+
+    python -m bench.bench_batch --items 200 --latency 0.1 --concurrency 1 5 10 25 50
+
+The rate limit is lifted so only concurrency and PayHero latency matter;
+throughput should scale roughly as concurrency / latency until the worker
+runs out of CPU.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from bench.fake_payhero import start_fake_payhero
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    args = parser.parse_args()
+
+    server = start_fake_payhero(latency=args.latency)
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "PAYHERO_URL": server.url,
+        "PAYHERO_API_USERNAME": "user",
+        "PAYHERO_API_PASSWORD": "pass",
+        "PAYHERO_CHANNEL_ID": "5217",
+        "CALLBACK_URL": "http://127.0.0.1/api/payhero/callback",
+        "LOG_LEVEL": "WARNING",
+        "PAYHERO_POOL_SIZE": str(max(args.concurrency)),
+        "PAYHERO_RATE_LIMIT": "100000",
+        "RATE_LIMIT_BACKEND": "memory",
+        "BATCH_MAX_CONCURRENCY": str(max(args.concurrency)),
+        "TRANSACTIONS_DB": os.path.join(tmp.name, "bench.db"),
+        "CALLBACK_QUEUE_DB": os.path.join(tmp.name, "bench_queue.db"),
+        "IDEMPOTENCY_DB": os.path.join(tmp.name, "bench_idempotency.db"),
+        "RATE_LIMIT_DB": os.path.join(tmp.name, "bench_ratelimit.db"),
+        "STATUS_EVENTS_DB": os.path.join(tmp.name, "bench_status.db"),
+    })
+    import app
+
+    client = app.app.test_client()
+    print(f"{'concurrency':>11} {'items/s':>9} {'ok':>6}")
+    for concurrency in args.concurrency:
+        items = [
+            {"phone": "254700000000", "amount": 10, "reference": f"BATCH_{concurrency}_{i}"}
+            for i in range(args.items)
+        ]
+        started = time.perf_counter()
+        response = client.post(
+            "/api/stk-push/batch", json={"items": items, "concurrency": concurrency}
+        )
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        elapsed = time.perf_counter() - started
+        print(f"{concurrency:>11} {args.items / elapsed:>9.1f} {lines[-1]['succeeded']:>6}")
+
+    server.shutdown()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
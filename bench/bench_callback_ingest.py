@@ -0,0 +1,92 @@
+"""Callbacks/sec accepted by /api/payhero/callback while the drain is saturated.
+
+    python -m bench.bench_callback_ingest --duration 5 --clients 8 --apply-delay 0.05
+
+Replaces the app's callback worker with a single deliberately slow one
+(``--apply-delay`` seconds per callback) so the queue can only grow, then
+posts callbacks from ``--clients`` threads through the Flask test client.
+The accept rate should stay flat regardless of how slow the drain is.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--apply-delay", type=float, default=0.05,
+                        help="simulated processing time per callback in seconds")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "PAYHERO_API_USERNAME": "user",
+        "PAYHERO_API_PASSWORD": "pass",
+        "PAYHERO_CHANNEL_ID": "5217",
+        "CALLBACK_URL": "http://127.0.0.1/api/payhero/callback",
+        "LOG_LEVEL": "WARNING",
+        "TRANSACTIONS_DB": os.path.join(tmp.name, "bench.db"),
+        "CALLBACK_QUEUE_DB": os.path.join(tmp.name, "bench_queue.db"),
+        "IDEMPOTENCY_DB": os.path.join(tmp.name, "bench_idempotency.db"),
+        "RATE_LIMIT_DB": os.path.join(tmp.name, "bench_ratelimit.db"),
+        "STATUS_EVENTS_DB": os.path.join(tmp.name, "bench_status.db"),
+    })
+    import app
+    from callback_queue import CallbackWorker
+
+    app.callback_worker.stop()
+
+    def slow_handler(payloads):
+        time.sleep(args.apply_delay * len(payloads))
+        app.process_callbacks(payloads)
+
+    worker = CallbackWorker(app.callback_queue, slow_handler, threads=1, batch_size=10)
+    worker.start()
+
+    accepted = [0]
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+
+    def client(client_id):
+        test_client = app.app.test_client()
+        n = 0
+        while time.time() < deadline:
+            response = test_client.post("/api/payhero/callback", json={
+                "status": True,
+                "response": {
+                    "ExternalReference": f"BENCH_{client_id}_{n}",
+                    "CheckoutRequestID": f"ws_CO_BENCH_{client_id}_{n}",
+                    "ResultCode": 0,
+                    "ResultDesc": "The service request is processed successfully.",
+                    "MpesaReceiptNumber": "BENCH",
+                    "Status": "Success",
+                },
+            })
+            if response.status_code == 200:
+                with lock:
+                    accepted[0] += 1
+            n += 1
+
+    started = time.time()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    stats = {**app.callback_queue.stats(), **worker.stats()}
+    print(f"accepted {accepted[0]} callbacks in {wall:.1f}s = {accepted[0] / wall:.0f}/s")
+    print(f"drained {stats['processed']}, queue depth {stats['depth']}, "
+          f"lag {stats['lag_seconds']:.1f}s")
+
+    worker.stop()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""How many long-polling status clients one node can hold, and how fast they wake.
+
+    python -m bench.bench_long_poll --clients 1000 --workers 2
+
+Starts gunicorn in async mode against a fake PayHero, creates ``--clients``
+pushes through the batch endpoint, then opens one raw socket per push
+waiting on GET /api/stk-push/<reference>/status?wait=N. Once every client
+is parked it posts a success callback for each reference and measures how
+long each waiting client takes to get its answer. Reports worker RSS per
+held client. Needs ``ulimit -n`` above the client count.
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import tempfile
+import time
+
+import requests
+
+from bench.load_test import (
+    free_port,
+    percentile,
+    start_fake_payhero,
+    start_gunicorn,
+    wait_until_up,
+    workers_rss_kb,
+)
+
+
+def open_long_poll(port, reference, wait):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(
+        f"GET /api/stk-push/{reference}/status?wait={wait} HTTP/1.1\r\n"
+        f"Host: 127.0.0.1\r\nConnection: close\r\n\r\n".encode()
+    )
+    sock.setblocking(False)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--wait", type=float, default=25)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    payhero_port, app_port = free_port(), free_port()
+    fake = start_fake_payhero(payhero_port, 0.0)
+    server = start_gunicorn(
+        app_port, "async", args.workers,
+        f"http://127.0.0.1:{payhero_port}/api/v2/payments",
+        {
+            "LOG_LEVEL": "WARNING",
+            "PAYHERO_RATE_LIMIT": "100000",
+            "STATUS_WAIT_MAX": str(args.wait),
+            "WORKER_CONNECTIONS": str(args.clients + 100),
+            "TRANSACTIONS_DB": os.path.join(tmp.name, "poll.db"),
+            "CALLBACK_QUEUE_DB": os.path.join(tmp.name, "poll_queue.db"),
+            "IDEMPOTENCY_DB": os.path.join(tmp.name, "poll_idempotency.db"),
+            "RATE_LIMIT_DB": os.path.join(tmp.name, "poll_ratelimit.db"),
+            "STATUS_EVENTS_DB": os.path.join(tmp.name, "poll_status.db"),
+        },
+    )
+    base = f"http://127.0.0.1:{app_port}"
+    session = requests.Session()
+    try:
+        wait_until_up(f"http://127.0.0.1:{payhero_port}/")
+        wait_until_up(base + "/")
+
+        references = [f"POLL_{i}" for i in range(args.clients)]
+        response = session.post(base + "/api/stk-push/batch", json={
+            "items": [{"phone": "254700000000", "amount": 10, "reference": r} for r in references],
+            "concurrency": 50,
+        })
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        checkout_ids = {line["reference"]: line["response"]["CheckoutRequestID"] for line in lines[:-1]}
+
+        idle_rss = workers_rss_kb(server.pid)
+        selector = selectors.DefaultSelector()
+        for reference in references:
+            selector.register(open_long_poll(app_port, reference, args.wait),
+                              selectors.EVENT_READ, reference)
+
+        # let every request reach a worker and park
+        time.sleep(2)
+        held_rss = workers_rss_kb(server.pid)
+        answered_early = len(selector.select(timeout=0))
+        print(f"holding {args.clients} long-poll clients across {args.workers} workers "
+              f"({answered_early} answered before any callback)")
+        print(f"workers RSS {idle_rss / 1024:.1f} -> {held_rss / 1024:.1f} MiB "
+              f"(~{(held_rss - idle_rss) / args.clients:.1f} KiB per waiting client)")
+
+        sent_at, wake_latencies, buffers = {}, [], {}
+
+        def collect(timeout):
+            for key, _ in selector.select(timeout=timeout):
+                reference = key.data
+                chunk = key.fileobj.recv(65536)
+                if chunk:
+                    buffers[reference] = buffers.get(reference, b"") + chunk
+                    continue
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                wake_latencies.append(time.perf_counter() - sent_at[reference])
+
+        for reference in references:
+            sent_at[reference] = time.perf_counter()
+            session.post(base + "/api/payhero/callback", json={
+                "status": True,
+                "response": {
+                    "ExternalReference": reference,
+                    "CheckoutRequestID": checkout_ids[reference],
+                    "ResultCode": 0,
+                    "Status": "Success",
+                },
+            })
+            collect(0)
+        callbacks_done = time.perf_counter()
+
+        deadline = time.time() + args.wait + 5
+        while selector.get_map() and time.time() < deadline:
+            collect(1)
+        successes = sum(b'"SUCCESS"' in body for body in buffers.values())
+
+        print(f"posted {args.clients} callbacks in {callbacks_done - min(sent_at.values()):.2f}s")
+        print(f"{successes}/{args.clients} clients got SUCCESS; callback -> client wake-up "
+              f"p50 {percentile(wake_latencies, 50) * 1000:.0f} ms, "
+              f"p99 {percentile(wake_latencies, 99) * 1000:.0f} ms")
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Hot-path cost of logging and metrics, per call.
+
+    python -m bench.bench_observability
+    PROMETHEUS_MULTIPROC_DIR=$(mktemp -d) python -m bench.bench_observability
+
+Compares the old ``print()`` of a callback payload against the queued JSON
+logger (what the request thread pays) and a synchronous JSON handler (what
+that work costs when it is done inline), then times metric updates and the
+per-request overhead of the Flask instrumentation hooks. Run it a second
+time with PROMETHEUS_MULTIPROC_DIR set to measure gunicorn's
+multi-process metric path.
+"""
+import argparse
+import logging
+import os
+import time
+
+from flask import Flask, jsonify
+
+PAYLOAD = {
+    "forward_url": "",
+    "response": {
+        "Amount": 10,
+        "CheckoutRequestID": "ws_CO_16102026093000000712345678",
+        "ExternalReference": "OKOA_1792315000_ab12cd34",
+        "MerchantRequestID": "3202-70921557-1",
+        "MpesaReceiptNumber": "SJG3Q2WXYZ",
+        "Phone": "254712345678",
+        "ResultCode": 0,
+        "ResultDesc": "The service request is processed successfully.",
+        "Status": "Success",
+    },
+    "status": True,
+}
+
+
+def per_call_us(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    import logs
+    import metrics
+
+    devnull = open(os.devnull, "w")
+
+    def old_print():
+        print("=== PAYHERO CALLBACK RECEIVED ===", file=devnull)
+        print(PAYLOAD, file=devnull)
+
+    sync_logger = logging.getLogger("bench.sync")
+    sync_handler = logging.StreamHandler(devnull)
+    sync_handler.setFormatter(logs.JsonFormatter())
+    sync_logger.addHandler(sync_handler)
+    sync_logger.propagate = False
+
+    logs.setup_logging(stream=devnull)
+    queued_logger = logging.getLogger("bench.queued")
+
+    def log_sync():
+        sync_logger.info("payhero_callback.received", extra={"fields": {"payload": PAYLOAD}})
+
+    def log_queued():
+        queued_logger.info("payhero_callback.received", extra={"fields": {"payload": PAYLOAD}})
+
+    mode = "multiprocess" if "PROMETHEUS_MULTIPROC_DIR" in os.environ else "in-process"
+    print(f"metrics mode: {mode}")
+    print(f"{'print() payload':<34} {per_call_us(old_print, args.count):8.2f} us/call")
+    print(f"{'JSON log, synchronous':<34} {per_call_us(log_sync, args.count):8.2f} us/call")
+    print(f"{'JSON log, queued (request path)':<34} {per_call_us(log_queued, args.count):8.2f} us/call")
+    logs.stop_logging()
+
+    histogram = metrics.REQUEST_LATENCY.labels("/bench", "GET", 200)
+    print(f"{'histogram observe':<34} "
+          f"{per_call_us(lambda: histogram.observe(0.012), args.count):8.2f} us/call")
+    print(f"{'counter inc (labels lookup)':<34} "
+          f"{per_call_us(lambda: metrics.CALLBACKS.labels('SUCCESS').inc(), args.count):8.2f} us/call")
+
+    plain, instrumented = Flask("plain"), Flask("instrumented")
+    metrics.instrument(instrumented)
+    for flask_app in (plain, instrumented):
+        flask_app.add_url_rule("/", "home", lambda: (jsonify({"status": "OK"}), 200))
+
+    plain_client, instrumented_client = plain.test_client(), instrumented.test_client()
+    requests_count = max(args.count // 10, 1)
+    base = per_call_us(lambda: plain_client.get("/"), requests_count)
+    hooked = per_call_us(lambda: instrumented_client.get("/"), requests_count)
+    print(f"{'request without metrics hooks':<34} {base:8.2f} us/request")
+    print(f"{'request with metrics hooks':<34} {hooked:8.2f} us/request (+{hooked - base:.2f})")
+
+
+if __name__ == "__main__":
+    main()
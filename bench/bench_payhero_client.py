@@ -0,0 +1,89 @@
+"""Latency of a fresh ``requests.post`` per call vs the pooled PayHeroClient.
+
+    python -m bench.bench_payhero_client --requests 500
+
+Runs against a local fake PayHero over plain HTTP, so the gap shown here is
+TCP setup only; against backend.payhero.co.ke each fresh call also pays a
+full TLS handshake, which the pooled client skips.
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from bench.fake_payhero import start_fake_payhero
+from payhero_client import PayHeroClient, basic_auth_header
+
+PAYLOAD = {
+    "amount": 10,
+    "phone_number": "254700000000",
+    "channel_id": 5217,
+    "provider": "m-pesa",
+    "external_reference": "OKOA_BENCH",
+    "customer_name": "Customer",
+    "callback_url": "http://127.0.0.1/api/payhero/callback",
+}
+
+
+def fresh_post(url):
+    headers = {
+        "Authorization": basic_auth_header("user", "pass"),
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+    response = requests.post(url, json=PAYLOAD, headers=headers, timeout=30)
+    response.content
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def report(name, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{name:<22} mean {statistics.mean(ms):7.3f} ms"
+          f"  p50 {percentile(ms, 50):7.3f} ms  p99 {percentile(ms, 99):7.3f} ms")
+
+
+def run(fn, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="simulated PayHero processing time in seconds")
+    args = parser.parse_args()
+
+    server = start_fake_payhero(latency=args.latency)
+    client = PayHeroClient("user", "pass", url=server.url)
+
+    # warm up both paths (and the pool) before measuring
+    fresh_post(server.url)
+    client.post_payment(PAYLOAD)
+
+    report("requests.post (fresh)", run(lambda: fresh_post(server.url), args.requests))
+
+    timings = []
+
+    def pooled():
+        timings.append(client.post_payment(PAYLOAD).timing)
+
+    report("PayHeroClient (pooled)", run(pooled, args.requests))
+    reused = sum(t.reused for t in timings)
+    print(f"pooled connections reused: {reused}/{len(timings)}")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
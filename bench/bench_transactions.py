@@ -0,0 +1,72 @@
+"""Insert and lookup throughput of the SQLite ledger as the table grows.
+
+    python -m bench.bench_transactions --sizes 10000 100000 1000000
+
+At each size the table is topped up in bulk, then we time ``--ops``
+single-row inserts (one commit each, as stk_push does) and ``--ops`` random
+point lookups by reference and by checkout ID. Flat numbers across sizes
+are the O(log n) index doing its job.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from transactions import SQLiteTransactionRepository
+
+BULK_CHUNK = 50000
+
+
+def fill(repo, start, stop):
+    now = time.time()
+    with repo._pool.connection() as conn:
+        for chunk_start in range(start, stop, BULK_CHUNK):
+            chunk_stop = min(chunk_start + BULK_CHUNK, stop)
+            conn.executemany(
+                """
+                INSERT INTO transactions (external_reference, checkout_request_id, phone_number,
+                                          amount, customer_name, status, created_at, updated_at)
+                VALUES (?, ?, '254700000000', 10, 'Customer', 'QUEUED', ?, ?)
+                """,
+                ((f"OKOA_{i}", f"ws_CO_{i}", now, now) for i in range(chunk_start, chunk_stop)),
+            )
+
+
+def rate(count, fn):
+    started = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--ops", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = SQLiteTransactionRepository(os.path.join(tmp, "bench.db"))
+        rows = 0
+        extra = 0
+
+        print(f"{'rows':>10} {'insert/s':>10} {'get/s':>10} {'by-checkout/s':>14}")
+        for size in sorted(args.sizes):
+            fill(repo, rows, size)
+            rows = size
+
+            def inserts():
+                nonlocal extra
+                for _ in range(args.ops):
+                    repo.create_pending(f"NEW_{extra}", "254700000000", 10, "Customer")
+                    extra += 1
+
+            ids = [random.randrange(rows) for _ in range(args.ops)]
+            insert_rate = rate(args.ops, inserts)
+            get_rate = rate(args.ops, lambda: [repo.get(f"OKOA_{i}") for i in ids])
+            checkout_rate = rate(args.ops, lambda: [repo.get_by_checkout_id(f"ws_CO_{i}") for i in ids])
+            print(f"{rows:>10} {insert_rate:>10.0f} {get_rate:>10.0f} {checkout_rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
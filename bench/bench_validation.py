@@ -0,0 +1,118 @@
+"""Per-request cost of push validation, and upstream calls it saves.
+
+    python -m bench.bench_validation --count 50000 --requests 1000
+
+First times PushRequestSchema.validate on valid and invalid bodies against
+the old ad hoc check (``not phone or not amount`` plus ``int(amount)``).
+Then sends a mixed corpus of good and bad requests through /api/stk-push
+against a local fake PayHero and compares how many reached PayHero with
+how many the old check would have let through.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from bench.fake_payhero import start_fake_payhero
+from schemas import PushRequestSchema
+
+VALID = [
+    {"phone": "0712345678", "amount": 100},
+    {"phone": "+254712345678", "amount": "250"},
+    {"phone": "0112 345 678", "amount": 50},
+    {"phone": "254798765432", "amount": 1000, "reference": "INV-2041"},
+]
+# Bodies the old check passed straight to PayHero
+INVALID_BUT_SENT = [
+    {"phone": "0812345678", "amount": 100},  # not a mobile prefix
+    {"phone": "07123", "amount": 100},  # too short
+    {"phone": "phone", "amount": 100},
+    {"phone": "0712345678", "amount": -50},
+    {"phone": "0712345678", "amount": 900000},  # above the M-Pesa limit
+    {"phone": "0712345678", "amount": 12.5},  # silently truncated to 12
+]
+# Bodies the old check caught (400) or crashed on (500)
+INVALID_AND_CAUGHT = [
+    {"phone": "0712345678"},
+    {"phone": "", "amount": 100},
+    {"phone": "0712345678", "amount": "abc"},
+]
+
+
+def old_check(data):
+    """The pre-schema stk_push checks: True if the request went upstream."""
+    phone, amount = data.get("phone"), data.get("amount")
+    if not phone or not amount:
+        return False
+    try:
+        int(amount)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def per_call_us(fn, bodies, count):
+    started = time.perf_counter()
+    for i in range(count):
+        fn(bodies[i % len(bodies)])
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--bad-share", type=float, default=0.2,
+                        help="fraction of the corpus with invalid input")
+    args = parser.parse_args()
+
+    schema = PushRequestSchema(1, 250000)
+    invalid = INVALID_BUT_SENT + INVALID_AND_CAUGHT
+    print(f"{'old check, valid body':<30} {per_call_us(old_check, VALID, args.count):6.2f} us")
+    print(f"{'schema, valid body':<30} {per_call_us(schema.validate, VALID, args.count):6.2f} us")
+    print(f"{'schema, invalid body':<30} {per_call_us(schema.validate, invalid, args.count):6.2f} us")
+
+    rng = random.Random(42)
+    corpus = []  # (body, is_valid)
+    for _ in range(args.requests):
+        is_valid = rng.random() >= args.bad_share
+        body = dict(rng.choice(VALID if is_valid else invalid))
+        body.pop("reference", None)  # every request is a distinct push
+        corpus.append((body, is_valid))
+
+    server = start_fake_payhero()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "PAYHERO_URL": server.url,
+        "PAYHERO_API_USERNAME": "user",
+        "PAYHERO_API_PASSWORD": "pass",
+        "PAYHERO_CHANNEL_ID": "5217",
+        "CALLBACK_URL": "http://127.0.0.1/api/payhero/callback",
+        "PAYHERO_RATE_LIMIT": "100000",
+        "RATE_LIMIT_BACKEND": "memory",
+        "LOG_LEVEL": "WARNING",
+        "TRANSACTIONS_DB": os.path.join(tmp.name, "bench.db"),
+        "CALLBACK_QUEUE_DB": os.path.join(tmp.name, "bench_queue.db"),
+        "IDEMPOTENCY_DB": os.path.join(tmp.name, "bench_idempotency.db"),
+        "RATE_LIMIT_DB": os.path.join(tmp.name, "bench_ratelimit.db"),
+        "STATUS_EVENTS_DB": os.path.join(tmp.name, "bench_status.db"),
+    })
+    import app
+
+    client = app.app.test_client()
+    rejected = sum(client.post("/api/stk-push", json=body).status_code == 422 for body, _ in corpus)
+
+    bad = sum(not is_valid for _, is_valid in corpus)
+    old_sent = sum(old_check(body) for body, _ in corpus)
+    old_wasted = sum(old_check(body) and not is_valid for body, is_valid in corpus)
+    print(f"corpus: {len(corpus)} requests, {bad} with invalid input")
+    print(f"old check: {old_sent} PayHero calls, {old_wasted} of them wasted on invalid input")
+    print(f"schema:    {server.payments} PayHero calls, {rejected} rejected with 422 up front")
+
+    server.shutdown()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
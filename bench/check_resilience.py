@@ -0,0 +1,137 @@
+"""Drive the PayHero resilience layer against a fault-injecting fake PayHero.
+
+    python -m bench.check_resilience
+
+Each scenario flips the fake into a failure mode and checks how
+/api/stk-push and /internal/resilience react. Exits non-zero if any check
+fails.
+"""
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from bench.fake_payhero import start_fake_payhero
+
+failures = []
+
+
+def check(name, condition, detail=""):
+    print(f"{'PASS' if condition else 'FAIL'}  {name}" + (f"  ({detail})" if detail else ""))
+    if not condition:
+        failures.append(name)
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    server = start_fake_payhero()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "PAYHERO_URL": server.url,
+        "PAYHERO_API_USERNAME": "user",
+        "PAYHERO_API_PASSWORD": "pass",
+        "PAYHERO_CHANNEL_ID": "5217",
+        "CALLBACK_URL": "http://127.0.0.1/api/payhero/callback",
+        "LOG_LEVEL": "CRITICAL",
+        "PAYHERO_READ_TIMEOUT": "0.5",
+        "PAYHERO_RATE_LIMIT": "1000",
+        "BREAKER_MIN_CALLS": "5",
+        "BREAKER_OPEN_SECONDS": "1",
+        "BREAKER_SLOW_CALL_SECONDS": "0.2",
+        "TRANSACTIONS_DB": os.path.join(tmp.name, "check.db"),
+        "CALLBACK_QUEUE_DB": os.path.join(tmp.name, "check_queue.db"),
+        "IDEMPOTENCY_DB": os.path.join(tmp.name, "check_idempotency.db"),
+        "RATE_LIMIT_DB": os.path.join(tmp.name, "check_ratelimit.db"),
+        "STATUS_EVENTS_DB": os.path.join(tmp.name, "check_status.db"),
+    })
+    import app
+    from payhero_client import PayHeroClient
+    from ratelimit import TokenBucket
+    from resilience import CircuitBreaker, ResilientPayHero
+
+    client = app.app.test_client()
+    breaker = app.payhero_upstream.breaker
+
+    def push():
+        started = time.perf_counter()
+        response = client.post("/api/stk-push", json={"phone": "254700000000", "amount": 10})
+        return response, time.perf_counter() - started
+
+    # --- error rate trips the breaker and it fails fast
+    server.error_rate = 1.0
+    statuses = [push()[0].status_code for _ in range(5)]
+    check("upstream 500s are passed through", statuses == [500] * 5, statuses)
+    check("breaker opens on error rate", breaker.state == "open")
+
+    response, elapsed = push()
+    check("open breaker answers 503", response.status_code == 503)
+    check("open breaker sets Retry-After", response.headers.get("Retry-After") == "1",
+          response.headers.get("Retry-After"))
+    check("open breaker fails fast", elapsed < 0.05, f"{elapsed * 1000:.1f} ms")
+    check("health check still answers", client.get("/").status_code == 200)
+
+    stats = client.get("/internal/resilience").get_json()
+    check("internal endpoint shows open breaker", stats["breaker"]["state"] == "open")
+
+    # --- half-open trial closes it again once PayHero recovers
+    server.error_rate = 0.0
+    time.sleep(1.05)
+    response, _ = push()
+    check("trial call after cool-off succeeds", response.status_code == 201)
+    check("breaker closes after successful trial", breaker.state == "closed")
+
+    # --- slow calls trip it as well
+    server.latency = 0.3
+    for _ in range(5):
+        push()
+    check("breaker opens on slow-call rate", breaker.state == "open")
+    server.latency = 0.0
+    time.sleep(1.05)
+    push()
+
+    # --- read timeouts are not retried (PayHero may already have the push)
+    server.latency = 1.0
+    retried = app.payhero_upstream.retried
+    response, elapsed = push()
+    check("read timeout returns 500", response.status_code == 500)
+    check("read timeout is not retried", app.payhero_upstream.retried == retried)
+    server.latency = 0.0
+
+    # --- connect errors are retried with backoff, then surface
+    dead = ResilientPayHero(
+        PayHeroClient("user", "pass", url=f"http://127.0.0.1:{closed_port()}/api/v2/payments"),
+        CircuitBreaker(min_calls=100),
+        TokenBucket(1000),
+        retries=2,
+        backoff_base=0.01,
+    )
+    try:
+        dead.post_payment({})
+        raised = False
+    except Exception:
+        raised = True
+    check("connect error raises after retries", raised)
+    check("connect error retried twice", dead.retried == 2, dead.retried)
+
+    # --- rate limiter rejects bursts past capacity with 429
+    app.payhero_upstream.limiter = TokenBucket(rate=1, capacity=2)
+    statuses = [push()[0] for _ in range(3)]
+    check("burst within capacity goes through", [r.status_code for r in statuses[:2]] == [201, 201])
+    check("request past capacity gets 429", statuses[2].status_code == 429)
+    check("429 sets Retry-After", statuses[2].headers.get("Retry-After") == "1")
+
+    server.shutdown()
+    tmp.cleanup()
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
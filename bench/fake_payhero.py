@@ -0,0 +1,105 @@
+"""Local stand-in for the PayHero payments API, for benchmarks and load tests.
+
+    python -m bench.fake_payhero --port 9000 --latency 0.2
+
+Answers ``POST /api/v2/payments`` with a PayHero-shaped "QUEUED" response
+after ``latency`` seconds. Speaks HTTP/1.1 so clients can keep connections
+alive. For fault injection, ``error_rate`` of requests get a 500 instead;
+both knobs can be changed on a running server.
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_checkout_ids = itertools.count(1)
+
+
+class FakePayHeroHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.payments += 1
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self._send_json(500, {"success": False, "error_message": "injected failure"})
+            return
+
+        self._send_json(201, {
+            "success": True,
+            "status": "QUEUED",
+            "reference": payload.get("external_reference"),
+            "CheckoutRequestID": f"ws_CO_FAKE_{next(_checkout_ids)}",
+        })
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePayHeroServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, error_rate=0.0):
+        super().__init__(address, FakePayHeroHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payments = 0  # payment requests received
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients that hit their read timeout hang up before we answer
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v2/payments"
+
+
+def start_fake_payhero(latency=0.0, error_rate=0.0, host="127.0.0.1", port=0):
+    """Run a fake PayHero in a background thread and return the server."""
+    server = FakePayHeroServer((host, port), latency=latency, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before answering each request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with a 500")
+    args = parser.parse_args()
+
+    server = FakePayHeroServer((args.host, args.port), latency=args.latency,
+                               error_rate=args.error_rate)
+    print(f"fake PayHero listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Load-test the STK push endpoint in sync vs async serving mode.
+
+    python -m bench.load_test --mode sync --mode async --latency 0.5 --concurrency 200
+
+For each mode this starts a fake PayHero with the given latency, starts
+gunicorn on app:app with OKOA_SERVING_MODE set, then hammers
+POST /api/stk-push from ``concurrency`` client threads for ``duration``
+seconds. Reports requests/sec, latency percentiles and the worker RSS growth
+per concurrent request.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def child_pids(parent):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent:
+            pids.append(int(entry))
+    return pids
+
+
+def rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def workers_rss_kb(master):
+    return sum(rss_kb(pid) for pid in child_pids(master))
+
+
+def start_fake_payhero(port, latency):
+    return subprocess.Popen(
+        [sys.executable, "-m", "bench.fake_payhero", "--port", str(port),
+         "--latency", str(latency)],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+
+
+def start_gunicorn(port, mode, workers, payhero_url, extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "OKOA_SERVING_MODE": mode,
+        "WEB_CONCURRENCY": str(workers),
+        "PAYHERO_URL": payhero_url,
+        "PAYHERO_API_USERNAME": "user",
+        "PAYHERO_API_PASSWORD": "pass",
+        "PAYHERO_CHANNEL_ID": "5217",
+        "CALLBACK_URL": "http://127.0.0.1/api/payhero/callback",
+    })
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--bind", f"127.0.0.1:{port}"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def hammer(url, concurrency, duration, body_for):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client(worker_id):
+        session = requests.Session()
+        n = 0
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                response = session.post(url, json=body_for(worker_id, n), timeout=60)
+                ok = response.status_code < 300
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    return threads, latencies, errors
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def run_mode(mode, args):
+    payhero_port, app_port = free_port(), free_port()
+    tmp = tempfile.TemporaryDirectory()
+    fake = start_fake_payhero(payhero_port, args.latency)
+    server = start_gunicorn(
+        app_port, mode, args.workers,
+        f"http://127.0.0.1:{payhero_port}/api/v2/payments",
+        {
+            "GUNICORN_THREADS": str(args.threads),
+            "TRANSACTIONS_DB": os.path.join(tmp.name, "load_test.db"),
+            "CALLBACK_QUEUE_DB": os.path.join(tmp.name, "load_test_queue.db"),
+            "IDEMPOTENCY_DB": os.path.join(tmp.name, "load_test_idempotency.db"),
+            "RATE_LIMIT_DB": os.path.join(tmp.name, "load_test_ratelimit.db"),
+            "STATUS_EVENTS_DB": os.path.join(tmp.name, "load_test_status.db"),
+            "PAYHERO_RATE_LIMIT": "100000",
+        },
+    )
+    base = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{payhero_port}/")
+        wait_until_up(base + "/")
+        idle_rss = workers_rss_kb(server.pid)
+
+        started = time.time()
+        threads, latencies, errors = hammer(
+            base + "/api/stk-push", args.concurrency, args.duration,
+            lambda worker, n: {"phone": "254700000000", "amount": 10,
+                               "reference": f"LOAD_{mode}_{worker}_{n}"},
+        )
+        peak_rss = idle_rss
+        while any(t.is_alive() for t in threads):
+            peak_rss = max(peak_rss, workers_rss_kb(server.pid))
+            time.sleep(0.2)
+        wall = time.time() - started
+
+        per_request_kb = (peak_rss - idle_rss) / args.concurrency
+        print(f"{mode:>5}: {len(latencies) / wall:8.1f} req/s"
+              f"  p50 {percentile(latencies, 50) * 1000:7.1f} ms"
+              f"  p99 {percentile(latencies, 99) * 1000:7.1f} ms"
+              f"  errors {errors[0]:5d}"
+              f"  workers RSS {idle_rss / 1024:.1f} -> {peak_rss / 1024:.1f} MiB"
+              f"  (~{per_request_kb:.1f} KiB per concurrent request)")
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+        tmp.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", action="append", choices=["sync", "async"],
+                        help="serving mode(s) to test (default: both)")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="fake PayHero response time in seconds")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1,
+                        help="GUNICORN_THREADS for sync mode")
+    args = parser.parse_args()
+
+    for mode in args.mode or ["sync", "async"]:
+        run_mode(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Durable outbox for PayHero callbacks and the workers that drain it.
+
+The callback endpoint only appends the raw payload here and returns; a
+``CallbackWorker`` pool claims rows in batches, applies them, then deletes
+them. Claims are leases: if a worker dies mid-batch its rows become
+claimable again once ``lease_seconds`` pass, so a crash replays rather than
+loses callbacks. Handlers must therefore be idempotent.
+"""
+import json
+import logging
+import threading
+import time
+
+from sqlite_pool import SQLitePool
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS callback_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_callback_queue_claimable
+    ON callback_queue (attempts, claimed_at, id);
+"""
+
+
+class CallbackQueue:
+    def __init__(self, path, pool_size=3, lease_seconds=30, max_attempts=5):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # FULL: the endpoint tells PayHero "received" as soon as this commits
+        self._pool = SQLitePool(path, size=pool_size, synchronous="FULL")
+        self._ready = threading.Event()
+        # Writers in one process queue on this lock instead of in SQLite's
+        # busy handler, whose backoff sleeps let a steady stream of inserts
+        # starve the drain's claims.
+        self._write_lock = threading.Lock()
+
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def put(self, payload):
+        with self._write_lock, self._pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO callback_queue (payload, enqueued_at) VALUES (?, ?)",
+                (json.dumps(payload), time.time()),
+            )
+        self.wake()
+
+    def claim(self, batch_size):
+        """Lease up to ``batch_size`` rows, oldest first. Returns (id, payload, enqueued_at)."""
+        now = time.time()
+        with self._write_lock, self._pool.connection() as conn:
+            rows = conn.execute(
+                """
+                UPDATE callback_queue
+                SET claimed_at = ?, attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM callback_queue
+                    WHERE attempts < ? AND (claimed_at IS NULL OR claimed_at < ?)
+                    ORDER BY id
+                    LIMIT ?
+                )
+                RETURNING id, payload, enqueued_at
+                """,
+                (now, self.max_attempts, now - self.lease_seconds, batch_size),
+            ).fetchall()
+        rows.sort(key=lambda row: row["id"])
+        return [(row["id"], json.loads(row["payload"]), row["enqueued_at"]) for row in rows]
+
+    def ack(self, ids):
+        with self._write_lock, self._pool.connection() as conn:
+            conn.executemany("DELETE FROM callback_queue WHERE id = ?", ((i,) for i in ids))
+
+    def release(self, ids):
+        """Make claimed rows immediately claimable again (after a failed batch)."""
+        with self._write_lock, self._pool.connection() as conn:
+            conn.executemany(
+                "UPDATE callback_queue SET claimed_at = NULL WHERE id = ?", ((i,) for i in ids)
+            )
+        self.wake()
+
+    def wait(self, timeout):
+        """Block until something is put (in this process) or ``timeout`` passes."""
+        self._ready.wait(timeout)
+        self._ready.clear()
+
+    def wake(self):
+        self._ready.set()
+
+    def stats(self):
+        now = time.time()
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                """
+                SELECT
+                    COUNT(*) AS depth,
+                    SUM(attempts >= ?) AS dead,
+                    MIN(CASE WHEN attempts < ? THEN enqueued_at END) AS oldest
+                FROM callback_queue
+                """,
+                (self.max_attempts, self.max_attempts),
+            ).fetchone()
+        return {
+            "depth": row["depth"],
+            "dead": row["dead"] or 0,
+            "lag_seconds": round(now - row["oldest"], 3) if row["oldest"] else 0.0,
+        }
+
+
+class CallbackWorker:
+    """Background threads that drain a CallbackQueue into ``handler``.
+
+    ``handler`` receives a list of payloads and must apply them all or raise.
+    When a batch raises, its rows are re-applied one at a time so a single
+    bad payload cannot hold back the rest: the good rows are acked and only
+    the failing ones are released, to be retried until ``max_attempts``.
+    """
+
+    def __init__(self, queue, handler, threads=2, batch_size=100, poll_interval=1.0):
+        self.queue = queue
+        self.handler = handler
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self.failed_batches = 0
+        self.failed_callbacks = 0
+        self.last_drain_lag = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, name=f"callback-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self.queue.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stop.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception:
+                log.exception("callback_queue.drain_failed")
+                drained = 0
+            if not drained:
+                self.queue.wait(self.poll_interval)
+
+    def drain_once(self):
+        batch = self.queue.claim(self.batch_size)
+        if not batch:
+            return 0
+
+        if self._apply(batch):
+            applied, failed = batch, []
+        else:
+            with self._lock:
+                self.failed_batches += 1
+            applied, failed = self._apply_one_by_one(batch) if len(batch) > 1 else ([], batch)
+
+        if failed:
+            self.queue.release([row_id for row_id, _, _ in failed])
+            with self._lock:
+                self.failed_callbacks += len(failed)
+        if not applied:
+            return 0
+
+        self.queue.ack([row_id for row_id, _, _ in applied])
+        with self._lock:
+            self.processed += len(applied)
+            self.last_drain_lag = time.time() - min(enqueued for _, _, enqueued in applied)
+        return len(applied)
+
+    def _apply(self, rows):
+        """Hand ``rows`` to the handler; False (and logged) if it raised."""
+        try:
+            self.handler([payload for _, payload, _ in rows])
+        except Exception:
+            log.exception("callback_queue.apply_failed", extra={"fields": {
+                "batch_size": len(rows), "first_id": rows[0][0],
+            }})
+            return False
+        return True
+
+    def _apply_one_by_one(self, batch):
+        """Split a failed batch into the rows that apply alone and those that don't."""
+        applied, failed = [], []
+        for row in batch:
+            (applied if self._apply([row]) else failed).append(row)
+        return applied, failed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "worker_threads": self.threads,
+                "processed": self.processed,
+                "failed_batches": self.failed_batches,
+                "failed_callbacks": self.failed_callbacks,
+                "last_drain_lag_seconds": round(self.last_drain_lag, 3),
+            }
@@ -0,0 +1,58 @@
+# Gunicorn settings, picked up automatically by `gunicorn app:app`.
+#
+# OKOA_SERVING_MODE selects how workers wait on PayHero:
+#   sync  - one request per thread; a worker holds GUNICORN_THREADS in-flight
+#           STK pushes (default, the original behaviour)
+#   async - gevent workers; the blocking PayHero call yields, so one worker can
+#           hold WORKER_CONNECTIONS in-flight pushes
+# Worker count still comes from WEB_CONCURRENCY, which gunicorn reads itself.
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+# Gunicorn reads this file before it puts the app directory on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from resilience import max_call_seconds  # noqa: E402
+from settings import load_payhero_call_limits  # noqa: E402
+
+serving_mode = os.getenv("OKOA_SERVING_MODE", "sync")
+
+if serving_mode == "async":
+    worker_class = "gevent"
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", 1000))
+    in_flight_per_worker = worker_connections
+elif serving_mode == "sync":
+    threads = int(os.getenv("GUNICORN_THREADS", 1))
+    in_flight_per_worker = threads
+else:
+    raise RuntimeError(f"OKOA_SERVING_MODE must be 'sync' or 'async', got {serving_mode!r}")
+
+# Size the PayHero connection pool to what a worker can actually have in flight
+os.environ.setdefault("PAYHERO_POOL_SIZE", str(in_flight_per_worker))
+
+# Never kill a worker while it is still legitimately waiting on PayHero:
+# allow the longest a PayHero call can take, plus some slack
+timeout = math.ceil(max_call_seconds(*load_payhero_call_limits())) + 10
+# The app sizes sync-mode batches to finish inside this
+os.environ["WORKER_TIMEOUT"] = str(timeout)
+
+# Metrics: workers write samples here and /metrics sums them. Must be set
+# before prometheus_client is first imported, hence the lazy import below.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "okoa-prometheus")
+)
+
+
+def on_starting(server):
+    # Files left by a previous run would be summed into this one
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
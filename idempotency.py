@@ -0,0 +1,327 @@
+"""Idempotency keys for STK pushes and PayHero callbacks.
+
+The first request for a key runs and, if it succeeded, its response is
+stored; repeats within the TTL get the stored response back instead of
+hitting PayHero (or the callback queue) again. Concurrent repeats in one process wait on the first
+call rather than racing it; repeats in other processes see the key as
+in flight in the shared store and poll until it completes.
+
+A key can carry a fingerprint of the request it was first used with; a
+repeat with a different fingerprint is refused rather than answered with
+the first request's response.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_pool import SQLitePool
+
+NEW = "new"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+MISMATCH = "mismatch"
+
+IN_PROGRESS_RESPONSE = (
+    {"error": "a request with this idempotency key is already in progress"},
+    409,
+)
+
+MISMATCH_RESPONSE = (
+    {"error": "idempotency key was already used with a different request"},
+    422,
+)
+
+
+def fingerprint(value):
+    """Stable hash of a JSON-serialisable request, for ``Idempotency.run``."""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _conflicts(stored, fingerprint):
+    return stored is not None and fingerprint is not None and stored != fingerprint
+
+
+class IdempotencyStore:
+    """Backend interface. Responses are stored as ``(body, status_code)``.
+
+    ``fingerprint`` is stored with the claim; ``None`` on either side skips
+    the comparison.
+    """
+
+    def begin(self, key, fingerprint=None):
+        """Claim ``key``. Returns ``(NEW, None)``, ``(IN_FLIGHT, None)``,
+        ``(DONE, response)`` or ``(MISMATCH, None)`` if the key was claimed
+        with a different fingerprint."""
+        raise NotImplementedError
+
+    def get(self, key, fingerprint=None):
+        """The stored response for ``key``, or ``None`` if absent, not
+        finished or stored under a different fingerprint."""
+        raise NotImplementedError
+
+    def complete(self, key, response, fingerprint=None):
+        raise NotImplementedError
+
+    def abandon(self, key):
+        """Drop an in-flight claim so the next request for ``key`` runs again."""
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Per-process LRU with TTL; only correct with a single worker process."""
+
+    def __init__(self, ttl=86400, max_entries=100000, in_flight_ttl=60):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.in_flight_ttl = in_flight_ttl
+        self._entries = OrderedDict()  # key -> (state, response, expires_at, fingerprint)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _set(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def begin(self, key, fingerprint=None):
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                self._set(key, (IN_FLIGHT, None, now + self.in_flight_ttl, fingerprint))
+                return NEW, None
+        if _conflicts(entry[3], fingerprint):
+            return MISMATCH, None
+        return entry[0], entry[1]
+
+    def get(self, key, fingerprint=None):
+        with self._lock:
+            entry = self._live(key, time.time())
+        if entry is None or entry[0] != DONE or _conflicts(entry[3], fingerprint):
+            return None
+        return entry[1]
+
+    def complete(self, key, response, fingerprint=None):
+        with self._lock:
+            self._set(key, (DONE, response, time.time() + self.ttl, fingerprint))
+
+    def abandon(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    status_code INTEGER,
+    body TEXT,
+    fingerprint TEXT,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at
+    ON idempotency_keys (expires_at);
+"""
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Store shared by every gunicorn worker on the node through one SQLite file.
+
+    Expired keys are purged, and the oldest keys trimmed past ``max_entries``,
+    every ``prune_every`` completions.
+    """
+
+    def __init__(self, path, ttl=86400, max_entries=100000, in_flight_ttl=60,
+                 pool_size=3, prune_every=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.in_flight_ttl = in_flight_ttl
+        self.prune_every = prune_every
+        self._completions = 0
+        self._pool = SQLitePool(path, size=pool_size)
+
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = conn.execute("PRAGMA table_info(idempotency_keys)").fetchall()
+            if "fingerprint" not in {column["name"] for column in columns}:
+                # File created before fingerprints were stored
+                conn.execute("ALTER TABLE idempotency_keys ADD COLUMN fingerprint TEXT")
+
+    def begin(self, key, fingerprint=None):
+        now = time.time()
+        with self._pool.connection() as conn:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND expires_at <= ?", (key, now)
+            )
+            cursor = conn.execute(
+                """
+                INSERT INTO idempotency_keys (key, state, fingerprint, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO NOTHING
+                """,
+                (key, IN_FLIGHT, fingerprint, now + self.in_flight_ttl),
+            )
+            if cursor.rowcount == 1:
+                return NEW, None
+            row = conn.execute(
+                "SELECT state, status_code, body, fingerprint FROM idempotency_keys WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if _conflicts(row["fingerprint"], fingerprint):
+            return MISMATCH, None
+        if row["state"] != DONE:
+            return IN_FLIGHT, None
+        return DONE, (json.loads(row["body"]), row["status_code"])
+
+    def get(self, key, fingerprint=None):
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                """
+                SELECT status_code, body, fingerprint FROM idempotency_keys
+                WHERE key = ? AND state = ? AND expires_at > ?
+                """,
+                (key, DONE, time.time()),
+            ).fetchone()
+        if row is None or _conflicts(row["fingerprint"], fingerprint):
+            return None
+        return json.loads(row["body"]), row["status_code"]
+
+    def complete(self, key, response, fingerprint=None):
+        body, status_code = response
+        with self._pool.connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO idempotency_keys (key, state, status_code, body, fingerprint, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = excluded.state,
+                    status_code = excluded.status_code,
+                    body = excluded.body,
+                    fingerprint = excluded.fingerprint,
+                    expires_at = excluded.expires_at
+                """,
+                (key, DONE, status_code, json.dumps(body), fingerprint, time.time() + self.ttl),
+            )
+
+        self._completions += 1
+        if self._completions % self.prune_every == 0:
+            self.prune()
+
+    def abandon(self, key):
+        with self._pool.connection() as conn:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND state = ?", (key, IN_FLIGHT)
+            )
+
+    def prune(self):
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                """
+                DELETE FROM idempotency_keys WHERE key IN (
+                    SELECT key FROM idempotency_keys
+                    ORDER BY expires_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+
+class _Call:
+    __slots__ = ("done", "response", "fingerprint")
+
+    def __init__(self, fingerprint):
+        self.done = threading.Event()
+        self.response = None
+        self.fingerprint = fingerprint
+
+
+class Idempotency:
+    """Runs a function at most once per key within the store's TTL.
+
+    ``fn`` returns ``(body, status_code)``. Only 2xx responses are stored:
+    after an error, a 4xx refusal (PayHero's, e.g. a 401 during a
+    credentials outage, or our own) or an exception, a retry runs again and
+    the ledger decides whether the reference may be pushed again. A
+    repeat whose ``fingerprint`` differs from the first call's gets
+    ``MISMATCH_RESPONSE`` and ``fn`` is not run.
+    """
+
+    def __init__(self, store, wait_timeout=35, poll_interval=0.1):
+        self.store = store
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn, fingerprint=None):
+        """Returns ``(body, status_code, replayed)``."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(fingerprint)
+
+        if not leader:
+            if _conflicts(call.fingerprint, fingerprint):
+                return MISMATCH_RESPONSE + (False,)
+            # Coalesce onto the call already running in this process
+            if not call.done.wait(self.wait_timeout) or call.response is None:
+                return IN_PROGRESS_RESPONSE + (False,)
+            if call.response in (IN_PROGRESS_RESPONSE, MISMATCH_RESPONSE):
+                return call.response + (False,)
+            return call.response + (True,)
+
+        try:
+            body, status_code, replayed = self._run_once(key, fn, fingerprint)
+            call.response = (body, status_code)
+            return body, status_code, replayed
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_once(self, key, fn, fingerprint):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            state, response = self.store.begin(key, fingerprint)
+            if state == DONE:
+                return response + (True,)
+            if state == MISMATCH:
+                return MISMATCH_RESPONSE + (False,)
+            if state == NEW:
+                break
+            # Another process holds the key; wait for it to finish
+            if time.monotonic() >= deadline:
+                return IN_PROGRESS_RESPONSE + (False,)
+            time.sleep(self.poll_interval)
+            response = self.store.get(key, fingerprint)
+            if response is not None:
+                return response + (True,)
+
+        try:
+            body, status_code = fn()
+        except BaseException:
+            self.store.abandon(key)
+            raise
+
+        if not 200 <= status_code < 300:
+            self.store.abandon(key)
+        else:
+            self.store.complete(key, (body, status_code), fingerprint)
+        return body, status_code, False
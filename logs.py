@@ -0,0 +1,94 @@
+"""JSON-lines logging that never blocks the request path.
+
+``setup_logging()`` routes every record through a QueueHandler; a single
+listener thread does the formatting, phone-number masking and writing to
+stdout. Structured fields go in ``extra={"fields": {...}}``.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import time
+
+PII_KEYS = frozenset({"phone", "phone_number", "Phone", "PhoneNumber", "msisdn", "MSISDN"})
+_DIGITS = re.compile(r"\d")
+_PHONE_LIKE = re.compile(r"\+?\d{9,15}")
+
+_listener = None
+
+
+def mask_phone(value):
+    """Keep the country/network prefix and last three digits: 2547******789."""
+    value = str(value)
+    digits = _DIGITS.findall(value)
+    if len(digits) <= 7:
+        return "*" * len(value)
+    return value[:4] + "*" * (len(value) - 7) + value[-3:]
+
+
+def mask_text(text):
+    """Mask every phone-number-like run of digits inside free text."""
+    return _PHONE_LIKE.sub(lambda match: mask_phone(match.group()), text)
+
+
+def mask_pii(value):
+    if isinstance(value, dict):
+        return {
+            key: mask_phone(item) if key in PII_KEYS and item else mask_pii(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [mask_pii(item) for item in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(mask_pii(fields))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the record in the caller's thread; leave
+    # all of that to the listener so logging costs the request one put().
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, stream=None):
+    """Install the queue handler on the root logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [_DeferredQueueHandler(records)]
+    root.setLevel(level)
+
+
+def stop_logging():
+    """Flush and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,92 @@
+"""Prometheus metrics for the API and its PayHero upstream.
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so every
+worker writes its samples to shared files and /metrics aggregates all of
+them; without it (flask run, scripts) the default in-process registry is
+used.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    "okoa_http_request_duration_seconds",
+    "Time spent serving HTTP requests.",
+    ["route", "method", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "okoa_http_requests_in_flight",
+    "HTTP requests currently being served.",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+PAYHERO_LATENCY = Histogram(
+    "okoa_payhero_request_duration_seconds",
+    "Time from sending an STK push to PayHero to reading its full response.",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, float("inf")),
+)
+PAYHERO_RESPONSES = Counter(
+    "okoa_payhero_responses_total",
+    "PayHero calls by outcome: the HTTP status code, or error/rate_limited/circuit_open.",
+    ["status_code"],
+)
+CALLBACKS = Counter(
+    "okoa_callbacks_total",
+    "PayHero callbacks accepted, by payment status; duplicate deliveries excluded.",
+    ["status"],
+)
+# The callback's Status is whatever the sender put there; anything else is
+# counted as OTHER so a bad sender can't create unbounded label values
+CALLBACK_STATUSES = frozenset({"SUCCESS", "FAILED", "CANCELLED"})
+DUPLICATE_CALLBACKS = Counter(
+    "okoa_callbacks_duplicate_total",
+    "PayHero callback redeliveries acknowledged without being queued again.",
+)
+
+
+def count_callback(status):
+    CALLBACKS.labels(status if status in CALLBACK_STATUSES else "OTHER").inc()
+
+
+def render():
+    """Return ``(body, content_type)`` for the /metrics endpoint."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def instrument(app):
+    """Record latency and in-flight counts for every request ``app`` serves."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_metrics():
+        g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        if "metrics_started" in g:
+            REQUEST_LATENCY.labels(g.metrics_route, request.method, response.status_code).observe(
+                time.perf_counter() - g.metrics_started
+            )
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        if "metrics_route" in g:
+            REQUESTS_IN_FLIGHT.labels(g.metrics_route).dec()
@@ -0,0 +1,132 @@
+"""Shared, pooled HTTP client for the PayHero API.
+
+One ``PayHeroClient`` is created per worker process at startup and reused by
+every request, so connections (and their TLS sessions) to PayHero are kept
+alive instead of being re-established on each STK push.
+"""
+import base64
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# PayHero v2 STK Push endpoint
+PAYHERO_URL = "https://backend.payhero.co.ke/api/v2/payments"
+
+# Per-thread scratch space the timed connections write into while a request
+# is in progress; read back by PayHeroClient once the response arrives.
+_timings = threading.local()
+
+
+@dataclass
+class PayHeroTiming:
+    connect: float  # TCP connect, 0.0 when a pooled connection was reused
+    tls: float  # TLS handshake, 0.0 for plain HTTP or a reused connection
+    ttfb: float  # request sent -> response headers received
+    total: float  # whole call including reading the body
+    reused: bool
+
+    def as_dict(self):
+        return {
+            "connect_ms": round(self.connect * 1000, 2),
+            "tls_ms": round(self.tls * 1000, 2),
+            "ttfb_ms": round(self.ttfb * 1000, 2),
+            "total_ms": round(self.total * 1000, 2),
+            "reused": self.reused,
+        }
+
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        started = time.perf_counter()
+        sock = super()._new_conn()
+        _timings.tcp = time.perf_counter() - started
+        return sock
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        _timings.handshake = time.perf_counter() - started
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def basic_auth_header(username, password):
+    token = base64.b64encode(f"{username}:{password}".encode()).decode()
+    return f"Basic {token}"
+
+
+class PayHeroClient:
+    """Keep-alive session to PayHero with precomputed auth headers.
+
+    ``pool_size`` should match the number of requests a worker can have in
+    flight at once (gunicorn threads, or worker_connections for async
+    workers); anything above it opens throwaway connections.
+    """
+
+    def __init__(self, username, password, url=PAYHERO_URL, pool_size=10,
+                 connect_timeout=3.05, read_timeout=30):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+
+        adapter = _TimedAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": basic_auth_header(username, password),
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        })
+
+    def post_payment(self, payload):
+        """POST an STK push payload; the response carries a ``timing`` attribute."""
+        _timings.tcp = 0.0
+        _timings.handshake = 0.0
+
+        started = time.perf_counter()
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.content  # read the body so ``total`` covers the whole call
+        total = time.perf_counter() - started
+
+        connect = _timings.tcp
+        tls = max(_timings.handshake - connect, 0.0) if self.url.startswith("https") else 0.0
+        ttfb = max(response.elapsed.total_seconds() - _timings.handshake, 0.0)
+        response.timing = PayHeroTiming(
+            connect=connect,
+            tls=tls,
+            ttfb=ttfb,
+            total=total,
+            reused=_timings.handshake == 0.0,
+        )
+        return response
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,120 @@
+"""Token-bucket rate limiting for calls to PayHero."""
+import threading
+import time
+
+from sqlite_pool import SQLitePool
+
+
+def _capacity(rate, capacity):
+    """Bucket size, defaulting to one second of ``rate`` but never under one
+    token: a bucket that can't hold a whole token never grants a call."""
+    capacity = float(capacity or max(1.0, rate))
+    if capacity < 1:
+        raise ValueError(f"token bucket capacity must be at least 1, got {capacity}")
+    return capacity
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts of up to ``capacity``.
+
+    Shared by every thread in the process (see SQLiteTokenBucket for one
+    shared across processes); ``acquire`` blocks until a token is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = _capacity(rate, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available; returns seconds to wait otherwise (0.0 on success)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            tokens = self._tokens
+        return {"shared": False, "rate": self.rate, "capacity": self.capacity, "tokens": round(tokens, 2)}
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteTokenBucket:
+    """Token bucket whose state lives in SQLite, so all gunicorn workers on a
+    node draw from one budget. Same interface as TokenBucket.
+    """
+
+    def __init__(self, path, rate, capacity=None, name="payhero", pool_size=2):
+        self.rate = float(rate)
+        self.capacity = _capacity(rate, capacity)
+        self.name = name
+        self._pool = SQLitePool(path, size=pool_size)
+
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time()),
+            )
+
+    def try_acquire(self):
+        now = time.time()
+        with self._pool.connection() as conn:
+            # Refill and take in one statement so concurrent workers can't both spend the last token
+            taken = conn.execute(
+                """
+                UPDATE token_buckets
+                SET tokens = MIN(?, tokens + MAX(? - updated_at, 0) * ?) - 1, updated_at = ?
+                WHERE name = ? AND MIN(?, tokens + MAX(? - updated_at, 0) * ?) >= 1
+                RETURNING tokens
+                """,
+                (self.capacity, now, self.rate, now, self.name, self.capacity, now, self.rate),
+            ).fetchone()
+            if taken:
+                return 0.0
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+        tokens = min(self.capacity, row["tokens"] + max(now - row["updated_at"], 0) * self.rate)
+        return max(1 - tokens, 0.001) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def stats(self):
+        now = time.time()
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM token_buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+        tokens = min(self.capacity, row["tokens"] + max(now - row["updated_at"], 0) * self.rate)
+        return {"shared": True, "rate": self.rate, "capacity": self.capacity, "tokens": round(tokens, 2)}
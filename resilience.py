@@ -0,0 +1,225 @@
+"""Circuit breaker, rate limiting and connect retries around PayHero calls.
+
+When PayHero degrades we want to stop feeding it requests that will sit out
+the full read timeout: the breaker trips on a high error or slow-call rate
+and then rejects calls immediately until a cool-off has passed, so workers
+stay free for everything else (including health checks).
+"""
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Longest sleep between two connect attempts
+BACKOFF_CAP = 1.0
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"PayHero circuit is open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class RateLimitedError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"PayHero rate limit reached, retry in {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Per-process breaker over a sliding time window of recent calls.
+
+    Opens when at least ``min_calls`` calls in the last ``window_seconds``
+    have a failure rate or slow-call rate at or above the thresholds. After
+    ``open_seconds`` one trial call is let through (half-open): success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_rate=0.5, slow_call_rate=0.5, slow_call_seconds=10,
+                 window_seconds=60, min_calls=10, open_seconds=30):
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+
+        self.state = CLOSED
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.times_opened = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call may not go out right now.
+
+        Returns True when the call is the half-open trial; pass that to
+        ``cancel`` if the call then doesn't go out after all.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            raise CircuitOpenError(max(remaining, 1.0))
+
+    def check(self):
+        """Raise CircuitOpenError while open, without claiming the half-open trial."""
+        with self._lock:
+            if self.state != OPEN:
+                return
+            remaining = self._opened_at + self.open_seconds - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(max(remaining, 1.0))
+
+    def cancel(self, trial):
+        """Undo a ``before_call`` whose call never went out."""
+        if trial:
+            with self._lock:
+                self._trial_in_flight = False
+
+    def record(self, failed, duration):
+        now = time.monotonic()
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_in_flight = False
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                return
+
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+
+            if self.state == CLOSED and len(self._calls) >= self.min_calls:
+                total = len(self._calls)
+                failures = sum(call[1] for call in self._calls)
+                slow_calls = sum(call[2] for call in self._calls)
+                if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+                    self._open(now)
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.times_opened += 1
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            calls = [call for call in self._calls if call[0] >= now - self.window_seconds]
+            retry_after = 0.0
+            if self.state == OPEN:
+                retry_after = max(self._opened_at + self.open_seconds - now, 0.0)
+            return {
+                "state": self.state,
+                "window_calls": len(calls),
+                "window_failures": sum(call[1] for call in calls),
+                "window_slow_calls": sum(call[2] for call in calls),
+                "retry_after_seconds": round(retry_after, 1),
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+def max_call_seconds(connect_timeout, read_timeout, retries, backoff_cap=BACKOFF_CAP):
+    """Longest a PayHero call can run once it has a token: every connect
+    attempt times out, the last one connects and then times out reading,
+    and each retry sleeps the full backoff cap."""
+    return (retries + 1) * connect_timeout + read_timeout + retries * backoff_cap
+
+
+def is_connect_error(exc):
+    """True only when the request never reached PayHero, so a retry can't double-charge."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        reason = getattr(exc.args[0], "reason", None)
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+class ResilientPayHero:
+    """Wraps PayHeroClient.post_payment with the limiter, breaker and retries.
+
+    Only connect failures are retried (with full-jitter exponential backoff);
+    anything after the request may have reached PayHero is not, since the
+    customer could get a second STK prompt.
+    """
+
+    def __init__(self, client, breaker, limiter, retries=2, backoff_base=0.1,
+                 backoff_cap=BACKOFF_CAP):
+        self.client = client
+        self.breaker = breaker
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retried = 0
+
+    def max_call_seconds(self):
+        """Longest post_payment can run once it has a token; see max_call_seconds()."""
+        connect_timeout, read_timeout = self.client.timeout
+        return max_call_seconds(connect_timeout, read_timeout, self.retries, self.backoff_cap)
+
+    def wait_for_token(self):
+        """Block until the limiter grants a call; follow with post_payment(token_held=True).
+
+        Raises CircuitOpenError up front rather than queueing for a token
+        the call would not get to use.
+        """
+        self.breaker.check()
+        self.limiter.acquire()
+
+    def post_payment(self, payload, token_held=False):
+        """Raises RateLimitedError, CircuitOpenError or whatever the client raised."""
+        # Breaker first: calls it rejects must not spend rate-limit tokens
+        trial = self.breaker.before_call()
+        if not token_held:
+            wait = self.limiter.try_acquire()
+            if wait:
+                self.breaker.cancel(trial)
+                raise RateLimitedError(wait)
+
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            try:
+                response = self.client.post_payment(payload)
+            except Exception as e:
+                if is_connect_error(e) and attempt < self.retries:
+                    attempt += 1
+                    self.retried += 1
+                    time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+                    continue
+                self.breaker.record(True, time.monotonic() - started)
+                raise
+
+            self.breaker.record(response.status_code >= 500, time.monotonic() - started)
+            return response
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.stats(),
+            "rate_limiter": self.limiter.stats(),
+            "connect_retries": self.retried,
+        }
@@ -0,0 +1,119 @@
+"""Request validation for STK pushes and PayHero callbacks.
+
+Schemas are built once at startup with precompiled patterns, so checking a
+request costs a few regex matches. Anything that fails is rejected with a
+422 before we touch the ledger or PayHero.
+"""
+import re
+
+from transactions import callback_update
+
+# 07xx / 01xx, 7xx / 1xx, 2547xx / 2541xx and +254 forms, after stripping
+# spaces, dashes and dots
+_MSISDN = re.compile(r"(?:\+?254|0)?([17]\d{8})")
+_MSISDN_SEPARATORS = re.compile(r"[\s\-.]")
+_AMOUNT = re.compile(r"\d+(?:\.0*)?")
+_REFERENCE = re.compile(r"[A-Za-z0-9_\-]{1,64}")
+
+
+def normalize_msisdn(value):
+    """Return a Kenyan mobile number as 2547XXXXXXXX / 2541XXXXXXXX, or None."""
+    if not isinstance(value, (str, int)) or isinstance(value, bool):
+        return None
+    match = _MSISDN.fullmatch(_MSISDN_SEPARATORS.sub("", str(value)))
+    return "254" + match.group(1) if match else None
+
+
+class PushRequestSchema:
+    """Validates one STK push (the /api/stk-push body or one batch item)."""
+
+    def __init__(self, min_amount, max_amount, max_customer_name=100):
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.max_customer_name = max_customer_name
+
+    def validate(self, data):
+        """Returns ``(clean, errors)``; ``errors`` maps field name to message."""
+        if not isinstance(data, dict):
+            return None, {"body": "must be a JSON object"}
+
+        errors = {}
+
+        phone = data.get("phone")
+        msisdn = normalize_msisdn(phone)
+        if phone in (None, ""):
+            errors["phone"] = "is required"
+        elif msisdn is None:
+            errors["phone"] = "must be a Kenyan mobile number (07XX, 01XX, 2547XX or +2547XX)"
+
+        amount = self._amount(data.get("amount"))
+        if data.get("amount") in (None, ""):
+            errors["amount"] = "is required"
+        elif amount is None:
+            errors["amount"] = "must be a whole number of shillings"
+        elif not self.min_amount <= amount <= self.max_amount:
+            errors["amount"] = f"must be between {self.min_amount} and {self.max_amount}"
+
+        reference = data.get("reference")
+        if reference is not None and not (
+            isinstance(reference, str) and _REFERENCE.fullmatch(reference)
+        ):
+            errors["reference"] = "must be 1-64 letters, digits, '_' or '-'"
+
+        customer_name = data.get("customer_name", "Customer")
+        if not isinstance(customer_name, str) or not 0 < len(customer_name) <= self.max_customer_name:
+            errors["customer_name"] = f"must be a string of 1-{self.max_customer_name} characters"
+
+        if errors:
+            return None, errors
+        return {
+            "phone": msisdn,
+            "amount": amount,
+            "reference": reference,
+            "customer_name": customer_name,
+        }, {}
+
+    @staticmethod
+    def _amount(value):
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float):
+            return int(value) if value.is_integer() else None
+        if isinstance(value, str) and _AMOUNT.fullmatch(value):
+            return int(float(value))
+        return None
+
+
+class CallbackSchema:
+    """Validates a PayHero callback and extracts the ledger update from it."""
+
+    def validate(self, data):
+        """Returns ``(update, errors)`` like PushRequestSchema.validate."""
+        update = callback_update(data)
+        if update is None:
+            return None, {"response": "must include ExternalReference or CheckoutRequestID"}
+
+        errors = {}
+        for field, key in (("ExternalReference", "external_reference"),
+                           ("CheckoutRequestID", "checkout_request_id")):
+            value = update[key]
+            if value is not None and not isinstance(value, str):
+                errors[field] = "must be a string"
+        result_code = update["result_code"]
+        if result_code is not None and (isinstance(result_code, bool) or not isinstance(result_code, int)):
+            errors["ResultCode"] = "must be an integer"
+        # Everything else we store goes into a column as-is
+        response = data["response"]
+        status = response.get("Status")
+        if status is not None and not isinstance(status, str):
+            errors["Status"] = "must be a string"
+        for field in ("ResultDesc", "MpesaReceiptNumber", "Amount", "Phone"):
+            value = response.get(field)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+                errors[field] = "must be a string or a number"
+
+        if errors:
+            return None, errors
+        return update, {}
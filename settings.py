@@ -0,0 +1,214 @@
+"""Typed, validated configuration read once from the environment.
+
+``load_settings()`` runs at import time in app.py, so a missing or malformed
+variable stops the worker from booting with one message listing every
+problem, instead of surfacing as a 500 on the first STK push.
+"""
+import os
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from payhero_client import PAYHERO_URL
+
+
+class ConfigError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Settings:
+    payhero_api_username: str
+    payhero_api_password: str
+    payhero_channel_id: int  # 5217
+    callback_url: str  # https://okoa-chapaa-backend.onrender.com/api/payhero/callback
+    payhero_url: str
+
+    payhero_connect_timeout: float
+    payhero_read_timeout: float
+    # One pooled connection per request a worker can have in flight at once
+    payhero_pool_size: int
+
+    # Accepted STK push amounts, in KES
+    min_amount: int
+    max_amount: int
+
+    log_level: str
+
+    transactions_db: str
+    db_pool_size: int
+
+    callback_queue_db: str
+    callback_worker_threads: int
+    callback_batch_size: int
+
+    # "sqlite" shares keys across gunicorn workers; "memory" is per-process only
+    idempotency_backend: str
+    idempotency_db: str
+    idempotency_ttl: int
+    idempotency_max_keys: int
+
+    batch_max_items: int
+    batch_concurrency: int
+    batch_max_concurrency: int
+
+    # Both exported by gunicorn.conf.py. A sync worker is killed once one
+    # request runs longer than worker_timeout seconds (0: no such limit)
+    serving_mode: str
+    worker_timeout: float
+
+    # PayHero calls per second for the whole node; "sqlite" shares the budget
+    # across gunicorn workers, "memory" gives each worker its own
+    payhero_rate_limit: float
+    payhero_rate_limit_burst: float
+    rate_limit_backend: str
+    rate_limit_db: str
+    payhero_connect_retries: int
+
+    breaker_failure_rate: float
+    breaker_slow_call_rate: float
+    breaker_slow_call_seconds: float
+    breaker_window_seconds: float
+    breaker_min_calls: int
+    breaker_open_seconds: float
+
+    status_events_db: str
+    status_cache_ttl: int
+    # Longest a long-poll or SSE client is held (async serving mode only;
+    # sync mode answers at once). Must stay under the gunicorn timeout
+    status_wait_max: float
+
+
+class _Reader:
+    """Reads typed values from an environ mapping, collecting every error."""
+
+    def __init__(self, environ):
+        self.environ = environ
+        self.errors = []
+
+    def str(self, name, default=None, choices=None):
+        value = self.environ.get(name, default)
+        if value is None or value == "":
+            self.errors.append(f"{name} is required")
+            return None
+        if choices and value not in choices:
+            self.errors.append(f"{name} must be one of {', '.join(choices)}, got {value!r}")
+        return value
+
+    def _number(self, name, default, cast, minimum, maximum):
+        raw = self.environ.get(name)
+        if raw is None or raw == "":
+            if default is None:
+                self.errors.append(f"{name} is required")
+            return default
+        try:
+            value = cast(raw)
+        except ValueError:
+            self.errors.append(f"{name} must be {'an integer' if cast is int else 'a number'}, got {raw!r}")
+            return default
+        if minimum is not None and value < minimum:
+            self.errors.append(f"{name} must be >= {minimum}, got {value}")
+        if maximum is not None and value > maximum:
+            self.errors.append(f"{name} must be <= {maximum}, got {value}")
+        return value
+
+    def int(self, name, default=None, minimum=None, maximum=None):
+        return self._number(name, default, int, minimum, maximum)
+
+    def float(self, name, default=None, minimum=None, maximum=None):
+        return self._number(name, default, float, minimum, maximum)
+
+    def url(self, name, default=None):
+        value = self.str(name, default)
+        if value is not None:
+            parsed = urlparse(value)
+            if parsed.scheme not in ("http", "https") or not parsed.netloc:
+                self.errors.append(f"{name} must be an http(s) URL, got {value!r}")
+        return value
+
+
+def _payhero_call_limits(env):
+    return (
+        env.float("PAYHERO_CONNECT_TIMEOUT", 3.05, minimum=0.001),
+        env.float("PAYHERO_READ_TIMEOUT", 30, minimum=0.001),
+        env.int("PAYHERO_CONNECT_RETRIES", 2, minimum=0),
+    )
+
+
+def load_payhero_call_limits(environ=None):
+    """(connect_timeout, read_timeout, connect_retries) only, or raise ConfigError.
+
+    For gunicorn.conf.py, which sizes the worker timeout from these before
+    the rest of the configuration is needed.
+    """
+    env = _Reader(os.environ if environ is None else environ)
+    limits = _payhero_call_limits(env)
+    if env.errors:
+        raise ConfigError("invalid configuration:\n  " + "\n  ".join(env.errors))
+    return limits
+
+
+def load_settings(environ=None):
+    """Build Settings from ``environ`` (default ``os.environ``) or raise ConfigError."""
+    env = _Reader(os.environ if environ is None else environ)
+    backends = ("memory", "sqlite")
+
+    rate_limit = env.float("PAYHERO_RATE_LIMIT", 20, minimum=0.001)
+    connect_timeout, read_timeout, connect_retries = _payhero_call_limits(env)
+    settings = Settings(
+        payhero_api_username=env.str("PAYHERO_API_USERNAME"),
+        payhero_api_password=env.str("PAYHERO_API_PASSWORD"),
+        payhero_channel_id=env.int("PAYHERO_CHANNEL_ID", minimum=1),
+        callback_url=env.url("CALLBACK_URL"),
+        payhero_url=env.url("PAYHERO_URL", PAYHERO_URL),
+        payhero_connect_timeout=connect_timeout,
+        payhero_read_timeout=read_timeout,
+        payhero_pool_size=env.int("PAYHERO_POOL_SIZE", 10, minimum=1),
+        min_amount=env.int("MIN_AMOUNT", 1, minimum=1),
+        max_amount=env.int("MAX_AMOUNT", 250000, minimum=1),
+        log_level=(env.str("LOG_LEVEL", "INFO") or "").upper(),
+        transactions_db=env.str("TRANSACTIONS_DB", "okoa.db"),
+        db_pool_size=env.int("DB_POOL_SIZE", 5, minimum=1),
+        callback_queue_db=env.str("CALLBACK_QUEUE_DB", "okoa_queue.db"),
+        callback_worker_threads=env.int("CALLBACK_WORKER_THREADS", 2, minimum=1),
+        callback_batch_size=env.int("CALLBACK_BATCH_SIZE", 100, minimum=1),
+        idempotency_backend=env.str("IDEMPOTENCY_BACKEND", "sqlite", choices=backends),
+        idempotency_db=env.str("IDEMPOTENCY_DB", "okoa_idempotency.db"),
+        idempotency_ttl=env.int("IDEMPOTENCY_TTL", 86400, minimum=1),
+        idempotency_max_keys=env.int("IDEMPOTENCY_MAX_KEYS", 100000, minimum=1),
+        batch_max_items=env.int("BATCH_MAX_ITEMS", 5000, minimum=1),
+        batch_concurrency=env.int("BATCH_CONCURRENCY", 10, minimum=1),
+        batch_max_concurrency=env.int("BATCH_MAX_CONCURRENCY", 50, minimum=1),
+        serving_mode=env.str("OKOA_SERVING_MODE", "sync", choices=("sync", "async")),
+        worker_timeout=env.float("WORKER_TIMEOUT", 0, minimum=0),
+        payhero_rate_limit=rate_limit,
+        # Under 1 the bucket never holds a whole token and every push is refused
+        payhero_rate_limit_burst=env.float(
+            "PAYHERO_RATE_LIMIT_BURST", max(1.0, rate_limit), minimum=1
+        ),
+        rate_limit_backend=env.str("RATE_LIMIT_BACKEND", "sqlite", choices=backends),
+        rate_limit_db=env.str("RATE_LIMIT_DB", "okoa_ratelimit.db"),
+        payhero_connect_retries=connect_retries,
+        breaker_failure_rate=env.float("BREAKER_FAILURE_RATE", 0.5, minimum=0.01, maximum=1),
+        breaker_slow_call_rate=env.float("BREAKER_SLOW_CALL_RATE", 0.5, minimum=0.01, maximum=1),
+        breaker_slow_call_seconds=env.float("BREAKER_SLOW_CALL_SECONDS", 10, minimum=0.001),
+        breaker_window_seconds=env.float("BREAKER_WINDOW_SECONDS", 60, minimum=1),
+        breaker_min_calls=env.int("BREAKER_MIN_CALLS", 10, minimum=1),
+        breaker_open_seconds=env.float("BREAKER_OPEN_SECONDS", 30, minimum=0.001),
+        status_events_db=env.str("STATUS_EVENTS_DB", "okoa_status.db"),
+        status_cache_ttl=env.int("STATUS_CACHE_TTL", 600, minimum=1),
+        status_wait_max=env.float("STATUS_WAIT_MAX", 25, minimum=0),
+    )
+
+    if settings.min_amount and settings.max_amount and settings.min_amount > settings.max_amount:
+        env.errors.append("MIN_AMOUNT must not be greater than MAX_AMOUNT")
+    if settings.log_level and settings.log_level not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        env.errors.append(f"LOG_LEVEL must be a logging level name, got {settings.log_level!r}")
+    if settings.worker_timeout and settings.status_wait_max >= settings.worker_timeout:
+        env.errors.append(
+            f"STATUS_WAIT_MAX ({settings.status_wait_max:g}s) must be less than the worker "
+            f"timeout ({settings.worker_timeout:g}s), or held clients get their worker killed"
+        )
+
+    if env.errors:
+        raise ConfigError("invalid configuration:\n  " + "\n  ".join(env.errors))
+    return settings
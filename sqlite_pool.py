@@ -0,0 +1,113 @@
+"""Small pool of shared SQLite connections, used by the ledger and queues."""
+import queue
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+
+class SQLitePool:
+    """Fixed set of WAL-mode connections handed out one caller at a time.
+
+    ``synchronous`` is NORMAL by default; stores that acknowledge writes to
+    the outside world before anything else happens (the callback queue) use
+    FULL so an acknowledged row survives power loss.
+
+    Under gevent (the async serving profile) sqlite3 calls would block the
+    hub, stalling every other greenlet in the worker for the length of each
+    fsync or busy wait. When threading is monkey-patched, connections are
+    handed out wrapped so every statement and commit runs on the hub's native
+    threadpool instead; callers use them exactly like plain connections.
+    """
+
+    def __init__(self, path, size=5, synchronous="NORMAL", busy_timeout_ms=5000):
+        self.path = path
+        self._pool = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout_ms / 1000)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={synchronous}")
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; its transaction commits when the block exits."""
+        conn = self._pool.get()
+        try:
+            threadpool = _hub_threadpool()
+            if threadpool is None:
+                with conn:
+                    yield conn
+            else:
+                offloaded = _OffloadedConnection(conn, threadpool)
+                try:
+                    yield offloaded
+                except BaseException:
+                    offloaded.rollback()
+                    raise
+                offloaded.commit()
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def _hub_threadpool():
+    """The gevent hub's threadpool if gevent has patched threading, else None."""
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is None or not monkey.is_module_patched("threading"):
+        return None
+    import gevent
+    return gevent.get_hub().threadpool
+
+
+class _OffloadedConnection:
+    """Connection stand-in that runs each call on a gevent threadpool.
+
+    ``execute`` fetches every result row on the pool thread and returns a
+    ``_Result``, so callers never step a cursor from the hub.
+    """
+
+    def __init__(self, conn, threadpool):
+        self._conn = conn
+        self._threadpool = threadpool
+
+    def execute(self, sql, parameters=()):
+        return self._threadpool.apply(_run, (self._conn.execute, sql, parameters))
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._threadpool.apply(_run, (self._conn.executemany, sql, list(seq_of_parameters)))
+
+    def executescript(self, script):
+        return self._threadpool.apply(self._conn.executescript, (script,))
+
+    def commit(self):
+        self._threadpool.apply(self._conn.commit)
+
+    def rollback(self):
+        self._threadpool.apply(self._conn.rollback)
+
+
+def _run(method, *args):
+    cursor = method(*args)
+    rows = cursor.fetchall()
+    return _Result(rows, cursor.rowcount, cursor.lastrowid)
+
+
+class _Result:
+    """Already-fetched rows of a statement, with the cursor attributes callers use."""
+
+    __slots__ = ("_rows", "rowcount", "lastrowid")
+
+    def __init__(self, rows, rowcount, lastrowid):
+        self._rows = rows
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
@@ -0,0 +1,204 @@
+"""In-memory payment status cache with waiters, kept in sync across workers.
+
+Each gunicorn worker holds its own StatusCache. Whoever learns a new status
+(the push response, the callback) writes it to the local cache and publishes
+it through a StatusBroadcast; every other worker's listener thread picks it
+up from there, so status polls are answered from memory without touching
+the ledger. Long-poll and SSE clients block on the cache until a final
+status arrives.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_pool import SQLitePool
+from transactions import RETRYABLE_STATUSES
+
+log = logging.getLogger(__name__)
+
+# Anything else (SUCCESS, FAILED, CANCELLED, ERROR, NOT_SENT, PUSH_FAILED...) is
+# final; UNKNOWN is a push PayHero may have received, settled by its callback
+NON_FINAL_STATUSES = frozenset({"PENDING", "QUEUED", "UNKNOWN"})
+
+STATUS_FIELDS = (
+    "reference",
+    "status",
+    "checkout_request_id",
+    "result_code",
+    "result_desc",
+    "mpesa_receipt_number",
+)
+
+
+def is_final(status):
+    return status["status"] not in NON_FINAL_STATUSES
+
+
+def status_from_transaction(transaction):
+    status = {field: transaction.get(field) for field in STATUS_FIELDS}
+    status["reference"] = transaction["external_reference"]
+    return status
+
+
+class StatusCache:
+    def __init__(self, ttl=600, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # reference -> (status, expires_at, seq)
+        self._waiters = {}  # reference -> [Event set on the next update, waiter count]
+        self._lock = threading.Lock()
+
+    def get(self, reference):
+        with self._lock:
+            entry = self._entries.get(reference)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[reference]
+                return None
+            return entry[0]
+
+    def put(self, status, seq=None):
+        """Cache ``status``; ``seq`` is its id in the StatusBroadcast log.
+
+        Logged updates apply in log order, and a status read from the ledger
+        (no ``seq``) only fills a gap. A final result is never replaced by a
+        non-final one, unless it is a push that never got through
+        (``RETRYABLE_STATUSES``), which a retry of the reference supersedes.
+        """
+        reference = status["reference"]
+        with self._lock:
+            current = self._entries.get(reference)
+            if current and _superseded(status, seq, current):
+                return
+            self._entries[reference] = (status, time.monotonic() + self.ttl, seq)
+            self._entries.move_to_end(reference)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            waiter = self._waiters.pop(reference, None)
+        if waiter:
+            waiter[0].set()
+
+    def wait(self, reference, seen, timeout):
+        """Block until the status for ``reference`` differs from ``seen``.
+
+        Returns the current status (possibly still ``seen`` after ``timeout``).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                entry = self._entries.get(reference)
+                if entry is not None and entry[0] != seen:
+                    return entry[0]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return seen
+                waiter = self._waiters.setdefault(reference, [threading.Event(), 0])
+                waiter[1] += 1
+
+            waiter[0].wait(remaining)
+
+            with self._lock:
+                waiter[1] -= 1
+                if not waiter[1] and self._waiters.get(reference) is waiter:
+                    del self._waiters[reference]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached": len(self._entries),
+                "waiting_clients": sum(waiter[1] for waiter in self._waiters.values()),
+            }
+
+
+def _superseded(status, seq, current):
+    current_status, _, current_seq = current
+    if current_status == status:
+        return True
+    if current_seq is not None and (seq is None or seq <= current_seq):
+        return True
+    # Pushes and callbacks race across workers; a late QUEUED must not
+    # overwrite the callback's result
+    return (
+        is_final(current_status)
+        and current_status["status"] not in RETRYABLE_STATUSES
+        and not is_final(status)
+    )
+
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS status_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class StatusBroadcast:
+    """Fans status updates out to every worker's cache through a SQLite log.
+
+    Each worker polls the log once per ``poll_interval`` (one query per
+    worker, however many clients are polling it) and applies new rows to
+    its cache. Rows older than ``retention_seconds`` are pruned.
+    """
+
+    def __init__(self, path, cache, poll_interval=0.1, retention_seconds=300, pool_size=2):
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._pool = SQLitePool(path, size=pool_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_pruned = 0.0
+
+        with self._pool.connection() as conn:
+            conn.executescript(EVENTS_SCHEMA)
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM status_events").fetchone()[0]
+
+    def publish(self, status):
+        """Make the update visible to every worker and apply it locally now."""
+        now = time.time()
+        with self._pool.connection() as conn:
+            seq = conn.execute(
+                "INSERT INTO status_events (status, created_at) VALUES (?, ?)",
+                (json.dumps(status), now),
+            ).lastrowid
+            if now - self._last_pruned > self.retention_seconds / 10:
+                self._last_pruned = now
+                conn.execute(
+                    "DELETE FROM status_events WHERE created_at < ?", (now - self.retention_seconds,)
+                )
+        self.cache.put(status, seq)
+
+    def poll_once(self):
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, status FROM status_events WHERE id > ? ORDER BY id LIMIT 1000",
+                (self._last_id,),
+            ).fetchall()
+        for row in rows:
+            self.cache.put(json.loads(row["status"]), row["id"])
+            self._last_id = row["id"]
+        return len(rows)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="status-broadcast", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._stop.clear()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.poll_once():
+                    continue
+            except Exception:
+                log.exception("status_broadcast.poll_failed")
+            self._stop.wait(self.poll_interval)
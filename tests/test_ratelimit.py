@@ -0,0 +1,94 @@
+"""Unit tests for TokenBucket and SQLiteTokenBucket."""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import ratelimit
+from ratelimit import SQLiteTokenBucket, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+    clock_name = "monotonic"
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(ratelimit.time, self.clock_name, self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bucket(self, rate, capacity=None):
+        return TokenBucket(rate, capacity)
+
+    def test_capacity_defaults_to_one_second_of_rate(self):
+        self.assertEqual(self.bucket(20).capacity, 20)
+
+    def test_capacity_never_defaults_below_one_token(self):
+        self.assertEqual(self.bucket(0.2).capacity, 1)
+
+    def test_capacity_below_one_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.bucket(1, capacity=0.5)
+
+    def test_burst_up_to_capacity(self):
+        bucket = self.bucket(rate=2, capacity=3)
+        self.assertEqual([bucket.try_acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.try_acquire(), 0.5)
+
+    def test_refills_at_rate(self):
+        bucket = self.bucket(rate=2, capacity=1)
+        bucket.try_acquire()
+        self.clock.advance(0.25)
+        self.assertAlmostEqual(bucket.try_acquire(), 0.25)
+        self.clock.advance(0.25)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+
+    def test_refill_stops_at_capacity(self):
+        bucket = self.bucket(rate=10, capacity=2)
+        self.clock.advance(60)
+        self.assertEqual(bucket.stats()["tokens"], 2)
+
+    def test_slow_rate_still_grants_a_call(self):
+        bucket = self.bucket(rate=0.2)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertAlmostEqual(bucket.try_acquire(), 5)
+
+
+class SQLiteTokenBucketTest(TokenBucketTest):
+    clock_name = "time"
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "ratelimit.db")
+        self.buckets = 0
+
+    def bucket(self, rate, capacity=None):
+        self.buckets += 1
+        bucket = SQLiteTokenBucket(self.path, rate, capacity, name=f"test-{self.buckets}")
+        self.addCleanup(bucket._pool.close)
+        return bucket
+
+    def test_buckets_with_the_same_name_share_tokens(self):
+        first = SQLiteTokenBucket(self.path, rate=1, capacity=1)
+        second = SQLiteTokenBucket(self.path, rate=1, capacity=1)
+        self.addCleanup(first._pool.close)
+        self.addCleanup(second._pool.close)
+        self.assertEqual(first.try_acquire(), 0.0)
+        self.assertGreater(second.try_acquire(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,253 @@
+"""Unit tests for CircuitBreaker and ResilientPayHero."""
+import unittest
+from unittest import mock
+
+import requests
+
+import resilience
+from ratelimit import TokenBucket
+from resilience import (
+    CircuitBreaker, CircuitOpenError, RateLimitedError, ResilientPayHero, max_call_seconds,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class StubClient:
+    """Stands in for PayHeroClient: returns or raises each outcome in turn."""
+
+    timeout = (3.05, 30)
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def post_payment(self, payload):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class ClockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(resilience.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CircuitBreakerTest(ClockTestCase):
+    def breaker(self, **kwargs):
+        kwargs.setdefault("min_calls", 4)
+        kwargs.setdefault("open_seconds", 30)
+        return CircuitBreaker(**kwargs)
+
+    def trip(self, breaker):
+        for _ in range(breaker.min_calls):
+            breaker.before_call()
+            breaker.record(True, 0.1)
+
+    def test_stays_closed_below_min_calls(self):
+        breaker = self.breaker()
+        for _ in range(3):
+            breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_opens_on_failure_rate(self):
+        breaker = self.breaker(failure_rate=0.5)
+        breaker.record(False, 0.1)
+        breaker.record(False, 0.1)
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, "closed")
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.times_opened, 1)
+
+    def test_opens_on_slow_call_rate(self):
+        breaker = self.breaker(slow_call_seconds=10)
+        for _ in range(4):
+            breaker.record(False, 10)
+        self.assertEqual(breaker.state, "open")
+
+    def test_calls_outside_the_window_are_forgotten(self):
+        breaker = self.breaker(window_seconds=60)
+        for _ in range(3):
+            breaker.record(True, 0.1)
+        self.clock.advance(61)
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_open_breaker_rejects_until_cool_off(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(10)
+        with self.assertRaises(CircuitOpenError) as raised:
+            breaker.before_call()
+        self.assertAlmostEqual(raised.exception.retry_after, 20)
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(30)
+        self.assertTrue(breaker.before_call())
+        self.assertEqual(breaker.state, "half_open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_successful_trial_closes(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(30)
+        breaker.before_call()
+        breaker.record(False, 0.1)
+        self.assertEqual(breaker.state, "closed")
+        self.assertFalse(breaker.before_call())
+
+    def test_failed_trial_opens_again(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(30)
+        breaker.before_call()
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.times_opened, 2)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_cancel_hands_the_trial_back(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(30)
+        trial = breaker.before_call()
+        breaker.cancel(trial)
+        self.assertTrue(breaker.before_call())
+
+    def test_cancel_of_a_non_trial_is_a_no_op(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(30)
+        breaker.before_call()
+        breaker.cancel(False)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_check_raises_only_while_open(self):
+        breaker = self.breaker()
+        breaker.check()
+        self.trip(breaker)
+        with self.assertRaises(CircuitOpenError):
+            breaker.check()
+        self.clock.advance(30)
+        breaker.check()
+
+    def test_check_does_not_claim_the_trial(self):
+        breaker = self.breaker()
+        self.trip(breaker)
+        self.clock.advance(30)
+        breaker.check()
+        self.assertTrue(breaker.before_call())
+
+
+class ResilientPayHeroTest(ClockTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(resilience.time, "sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upstream(self, client, breaker=None, limiter=None, retries=2):
+        return ResilientPayHero(
+            client,
+            breaker or CircuitBreaker(min_calls=100),
+            limiter or TokenBucket(1000),
+            retries=retries,
+        )
+
+    def test_connect_errors_are_retried(self):
+        client = StubClient(requests.exceptions.ConnectTimeout(), Response(201))
+        upstream = self.upstream(client)
+        self.assertEqual(upstream.post_payment({}).status_code, 201)
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(upstream.retried, 1)
+        self.assertEqual(self.sleep.call_count, 1)
+        self.assertLessEqual(self.sleep.call_args[0][0], upstream.backoff_cap)
+
+    def test_connect_errors_surface_after_the_last_retry(self):
+        client = StubClient(*[requests.exceptions.ConnectTimeout() for _ in range(3)])
+        upstream = self.upstream(client, retries=2)
+        with self.assertRaises(requests.exceptions.ConnectTimeout):
+            upstream.post_payment({})
+        self.assertEqual(client.calls, 3)
+        self.assertEqual(upstream.breaker.stats()["window_failures"], 1)
+
+    def test_read_timeouts_are_not_retried(self):
+        client = StubClient(requests.exceptions.ReadTimeout(), Response(201))
+        upstream = self.upstream(client)
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            upstream.post_payment({})
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(upstream.retried, 0)
+
+    def test_5xx_counts_as_a_breaker_failure(self):
+        upstream = self.upstream(StubClient(Response(502), Response(400)))
+        upstream.post_payment({})
+        upstream.post_payment({})
+        self.assertEqual(upstream.breaker.stats()["window_failures"], 1)
+
+    def test_rate_limited_call_is_refused(self):
+        upstream = self.upstream(StubClient(Response(201)), limiter=TokenBucket(rate=1, capacity=1))
+        upstream.post_payment({})
+        with self.assertRaises(RateLimitedError):
+            upstream.post_payment({})
+
+    def test_open_breaker_does_not_spend_a_token(self):
+        limiter = TokenBucket(rate=1, capacity=1)
+        breaker = CircuitBreaker(min_calls=1)
+        breaker.record(True, 0.1)
+        upstream = self.upstream(StubClient(), breaker=breaker, limiter=limiter)
+        with self.assertRaises(CircuitOpenError):
+            upstream.post_payment({})
+        self.assertEqual(limiter.try_acquire(), 0.0)
+
+    def test_rate_limited_trial_is_handed_back(self):
+        breaker = CircuitBreaker(min_calls=1, open_seconds=30)
+        breaker.record(True, 0.1)
+        self.clock.advance(30)
+        limiter = TokenBucket(rate=1, capacity=1)
+        limiter.try_acquire()
+        upstream = self.upstream(StubClient(), breaker=breaker, limiter=limiter)
+        with self.assertRaises(RateLimitedError):
+            upstream.post_payment({})
+        self.assertTrue(breaker.before_call())
+
+    def test_token_held_skips_the_limiter(self):
+        limiter = TokenBucket(rate=1, capacity=1)
+        limiter.try_acquire()
+        upstream = self.upstream(StubClient(Response(201)), limiter=limiter)
+        self.assertEqual(upstream.post_payment({}, token_held=True).status_code, 201)
+
+    def test_max_call_seconds(self):
+        self.assertEqual(max_call_seconds(3, 30, 2, backoff_cap=1), 41)
+        upstream = self.upstream(StubClient(), retries=2)
+        self.assertAlmostEqual(upstream.max_call_seconds(), 3 * 3.05 + 30 + 2 * upstream.backoff_cap)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+"""Transaction ledger for STK pushes and their PayHero callbacks.
+
+A row is written as PENDING when we send the push, updated with PayHero's
+checkout ID once PayHero accepts it, and updated in place again when the
+callback arrives. Rows are looked up by ``external_reference`` (our
+reference) or by PayHero's ``CheckoutRequestID``; both are indexed.
+
+A reference can only be pushed again while its last push never reached
+PayHero or was refused by it (``RETRYABLE_STATUSES``); once PayHero has
+accepted a push the row is never reset, so a reused reference cannot wipe
+a payment or prompt the customer twice.
+"""
+import time
+
+from sqlite_pool import SQLitePool
+
+# Push outcomes after which the same reference may be pushed again: not
+# sent (rate limit / open circuit), could not connect, or refused by
+# PayHero. UNKNOWN (PayHero may have the push, e.g. after a read timeout)
+# is deliberately not here; the callback settles it.
+RETRYABLE_STATUSES = ("NOT_SENT", "ERROR", "PUSH_FAILED")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    external_reference TEXT PRIMARY KEY,
+    checkout_request_id TEXT,
+    phone_number TEXT,
+    amount INTEGER,
+    customer_name TEXT,
+    status TEXT NOT NULL,
+    result_code INTEGER,
+    result_desc TEXT,
+    mpesa_receipt_number TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_checkout_request_id
+    ON transactions (checkout_request_id);
+"""
+
+
+class TransactionRepository:
+    """Storage interface the app talks to; see SQLiteTransactionRepository."""
+
+    def create_pending(self, reference, phone_number, amount, customer_name):
+        """Start a push for ``reference``.
+
+        Returns False, leaving the row alone, when the reference already has
+        a push that is in progress or was accepted by PayHero.
+        """
+        raise NotImplementedError
+
+    def record_push_result(self, reference, status, checkout_request_id=None, result_desc=None):
+        """Record what the push call returned. Only a PENDING row is updated,
+        so a callback that got to the ledger first is never overwritten;
+        returns whether the row changed."""
+        raise NotImplementedError
+
+    def apply_callback(self, update):
+        raise NotImplementedError
+
+    def apply_callbacks(self, updates):
+        """Apply several callback updates in a single transaction."""
+        raise NotImplementedError
+
+    def get(self, reference):
+        raise NotImplementedError
+
+    def get_by_checkout_id(self, checkout_request_id):
+        raise NotImplementedError
+
+
+def callback_update(data):
+    """Pull the fields we store out of a PayHero callback payload.
+
+    Returns ``None`` when the payload has neither our reference nor a
+    checkout ID, i.e. there is nothing to match it against.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("response"), dict):
+        return None
+
+    response = data["response"]
+    reference = response.get("ExternalReference")
+    checkout_request_id = response.get("CheckoutRequestID")
+    if not reference and not checkout_request_id:
+        return None
+
+    status = response.get("Status")
+    if not status or not isinstance(status, str):
+        status = "SUCCESS" if response.get("ResultCode") == 0 else "FAILED"
+
+    return {
+        "external_reference": reference,
+        "checkout_request_id": checkout_request_id,
+        "status": status.upper(),
+        "result_code": response.get("ResultCode"),
+        "result_desc": response.get("ResultDesc"),
+        "mpesa_receipt_number": response.get("MpesaReceiptNumber"),
+        "phone_number": response.get("Phone"),
+        "amount": response.get("Amount"),
+    }
+
+
+class SQLiteTransactionRepository(TransactionRepository):
+    """SQLite ledger in WAL mode with a small pool of shared connections.
+
+    WAL lets every gunicorn worker read while one of them writes, and the
+    primary key / unique index keep point lookups O(log n).
+    """
+
+    def __init__(self, path, pool_size=5):
+        self.path = path
+        self._pool = SQLitePool(path, size=pool_size)
+
+        with self._pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def create_pending(self, reference, phone_number, amount, customer_name):
+        now = time.time()
+        with self._pool.connection() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO transactions (external_reference, phone_number, amount,
+                                          customer_name, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'PENDING', ?, ?)
+                ON CONFLICT (external_reference) DO UPDATE SET
+                    checkout_request_id = NULL,
+                    phone_number = excluded.phone_number,
+                    amount = excluded.amount,
+                    customer_name = excluded.customer_name,
+                    status = 'PENDING',
+                    result_code = NULL,
+                    result_desc = NULL,
+                    mpesa_receipt_number = NULL,
+                    updated_at = excluded.updated_at
+                WHERE transactions.status IN ({})
+                """.format(", ".join("?" * len(RETRYABLE_STATUSES))),
+                (reference, phone_number, amount, customer_name, now, now, *RETRYABLE_STATUSES),
+            )
+        return cursor.rowcount == 1
+
+    def record_push_result(self, reference, status, checkout_request_id=None, result_desc=None):
+        with self._pool.connection() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE transactions
+                SET status = ?, checkout_request_id = COALESCE(?, checkout_request_id),
+                    result_desc = ?, updated_at = ?
+                WHERE external_reference = ? AND status = 'PENDING'
+                """,
+                (status, checkout_request_id, result_desc, time.time(), reference),
+            )
+        return cursor.rowcount == 1
+
+    def apply_callback(self, update):
+        with self._pool.connection() as conn:
+            _apply_callback(conn, update)
+
+    def apply_callbacks(self, updates):
+        with self._pool.connection() as conn:
+            for update in updates:
+                _apply_callback(conn, update)
+
+    def get(self, reference):
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM transactions WHERE external_reference = ?", (reference,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_by_checkout_id(self, checkout_request_id):
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM transactions WHERE checkout_request_id = ?", (checkout_request_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+
+def _apply_callback(conn, update):
+    now = time.time()
+    fields = (
+        update["status"],
+        update["result_code"],
+        update["result_desc"],
+        update["mpesa_receipt_number"],
+        now,
+    )
+    set_clause = """
+        SET status = ?, result_code = ?, result_desc = ?,
+            mpesa_receipt_number = ?, updated_at = ?
+    """
+
+    if update["external_reference"]:
+        cursor = conn.execute(
+            f"UPDATE transactions {set_clause}, "
+            "checkout_request_id = COALESCE(checkout_request_id, ?) "
+            "WHERE external_reference = ?",
+            fields + (update["checkout_request_id"], update["external_reference"]),
+        )
+    else:
+        cursor = conn.execute(
+            f"UPDATE transactions {set_clause} WHERE checkout_request_id = ?",
+            fields + (update["checkout_request_id"],),
+        )
+
+    if cursor.rowcount == 0 and update["external_reference"]:
+        # Callback for a push we have no row for (e.g. sent before the ledger
+        # existed) - keep it so it can still be reconciled.
+        conn.execute(
+            """
+            INSERT INTO transactions (external_reference, checkout_request_id, phone_number,
+                                      amount, status, result_code, result_desc,
+                                      mpesa_receipt_number, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                update["external_reference"],
+                update["checkout_request_id"],
+                update["phone_number"],
+                update["amount"],
+                update["status"],
+                update["result_code"],
+                update["result_desc"],
+                update["mpesa_receipt_number"],
+                now,
+                now,
+            ),
+        )